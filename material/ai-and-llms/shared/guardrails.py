@@ -0,0 +1,132 @@
+"""
+Term-based guardrail engine shared by the extractor and the feedback analyzer
+
+Blocked terms (single words or phrases) are compiled into one Aho-Corasick
+automaton over word tokens, so the input is scanned once no matter how many
+thousands of terms are configured, and terms only ever match whole words:
+"root" matches "root access" but not "grassroots".
+
+Allowed phrases are compiled into the same automaton. A blocked match that
+lies inside an allowed phrase is ignored, which keeps legitimate text such as
+a receipt footer's "WiFi password" or a "root beer" line item from tripping
+the filter.
+
+Usage:
+    guardrails = GuardrailEngine(
+        {"security": ["password", "hack into"], "abuse": ["idiot", "idiots"]},
+        allowed=["wifi password"],
+    )
+    guardrails.matches("Can you help me hack into an account?")
+    # [GuardrailMatch(term='hack into', category='security', start=4, end=6)]
+"""
+
+import re
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Tuple
+
+_WORD = re.compile(r"\w+")
+_ALLOWED = "__allowed__"
+
+
+class GuardrailMatch(NamedTuple):
+    """A blocked term found in the input; start/end are word token indices"""
+
+    term: str
+    category: str
+    start: int
+    end: int
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+
+class GuardrailEngine:
+    """Word-level Aho-Corasick matcher for blocked terms with allowed exceptions"""
+
+    def __init__(
+        self,
+        blocked: Mapping[str, Iterable[str]],
+        allowed: Iterable[str] = (),
+    ):
+        # Patterns are (term, category, length in tokens)
+        self._patterns: List[Tuple[str, str, int]] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for category, terms in blocked.items():
+            for term in terms:
+                self._add(term, category)
+        for phrase in allowed:
+            self._add(phrase, _ALLOWED)
+        self._build_failure_links()
+
+    def matches(self, text: str) -> List[GuardrailMatch]:
+        """Blocked terms in text, excluding those covered by an allowed phrase"""
+        blocked: List[GuardrailMatch] = []
+        allowed: List[Tuple[int, int]] = []
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self._patterns
+
+        state = 0
+        for i, token in enumerate(tokenize(text)):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+
+            for index in out[state]:
+                term, category, length = patterns[index]
+                if category == _ALLOWED:
+                    allowed.append((i + 1 - length, i + 1))
+                else:
+                    blocked.append(
+                        GuardrailMatch(term, category, i + 1 - length, i + 1)
+                    )
+
+        if not allowed:
+            return blocked
+        return [
+            match
+            for match in blocked
+            if not any(
+                start <= match.start and match.end <= end for start, end in allowed
+            )
+        ]
+
+    def is_allowed(self, text: str) -> bool:
+        return not self.matches(text)
+
+    def __len__(self) -> int:
+        return sum(1 for _, category, _ in self._patterns if category != _ALLOWED)
+
+    def _add(self, term: str, category: str):
+        tokens = tokenize(term)
+        if not tokens:
+            return
+
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+
+        self._out[state].append(len(self._patterns))
+        self._patterns.append((" ".join(tokens), category, len(tokens)))
+
+    def _build_failure_links(self):
+        # Breadth-first, so a state's failure target is always finished first
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                # Inherit the matches of the longest proper suffix
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
@@ -0,0 +1,309 @@
+"""
+Rate-limit-aware scheduler shared by all OpenAI call sites
+
+Every call goes through a pair of token buckets (requests per minute and
+tokens per minute). Waiting callers are served strictly by priority, so an
+interactive request jumps ahead of queued batch work instead of competing
+with it. Rate limit and transient errors are retried with jittered
+exponential backoff, and a Retry-After header pauses the whole scheduler,
+not just the caller that got the 429.
+
+Usage:
+    scheduler = get_scheduler()
+    response = scheduler.call(
+        client.chat.completions.create,
+        model="gpt-4.1",
+        messages=[...],
+        priority=Priority.INTERACTIVE,
+    )
+
+Create OpenAI clients with max_retries=0 so retries are only done here.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, Callable, Optional
+
+import openai
+
+# How often queued callers re-check whether it's their turn
+POLL_INTERVAL = 0.02
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class Priority(IntEnum):
+    """Lower values are served first"""
+
+    INTERACTIVE = 0
+    DEFAULT = 5
+    BATCH = 10
+
+
+class TokenBucket:
+    """Budget that refills continuously up to its per-minute capacity"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        # Requests larger than the whole bucket wait for a full bucket, then go
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self.available -= amount
+
+    def refund(self, amount: float):
+        self.available = min(self.capacity, self.available + amount)
+
+
+class LLMScheduler:
+    """Priority scheduler enforcing RPM/TPM budgets with retries"""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        *args,
+        priority: Priority = Priority.DEFAULT,
+        estimated_tokens: Optional[int] = None,
+        on_wait: Optional[Callable[[float], None]] = None,
+        on_retry: Optional[Callable[[int, float], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run func(*args, **kwargs) within budget, retrying transient errors.
+
+        on_wait receives the seconds spent queueing for budget on each attempt,
+        on_retry the attempt number and backoff delay before each retry.
+        """
+        tokens = estimated_tokens or estimate_tokens(kwargs)
+        for attempt in itertools.count():
+            waited = self.acquire(tokens, priority)
+            if on_wait:
+                on_wait(waited)
+            try:
+                response = func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if on_retry:
+                    on_retry(attempt + 1, delay)
+                time.sleep(delay)
+                continue
+
+            self._settle(tokens, response)
+            return response
+
+    async def call_async(
+        self,
+        func: Callable[..., Any],
+        *args,
+        priority: Priority = Priority.DEFAULT,
+        estimated_tokens: Optional[int] = None,
+        on_wait: Optional[Callable[[float], None]] = None,
+        on_retry: Optional[Callable[[int, float], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """Async variant of call() for AsyncOpenAI methods"""
+        tokens = estimated_tokens or estimate_tokens(kwargs)
+        for attempt in itertools.count():
+            waited = await self.acquire_async(tokens, priority)
+            if on_wait:
+                on_wait(waited)
+            try:
+                response = await func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if on_retry:
+                    on_retry(attempt + 1, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self._settle(tokens, response)
+            return response
+
+    def acquire(self, tokens: int, priority: Priority = Priority.DEFAULT) -> float:
+        """
+        Block until this caller may send a request of about `tokens` tokens.
+
+        Returns the number of seconds spent waiting.
+        """
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while (wait := self._try_acquire(ticket, tokens)) > 0:
+                time.sleep(wait)
+        finally:
+            self._dequeue(ticket)
+        return time.monotonic() - start
+
+    async def acquire_async(
+        self, tokens: int, priority: Priority = Priority.DEFAULT
+    ) -> float:
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while (wait := self._try_acquire(ticket, tokens)) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._dequeue(ticket)
+        return time.monotonic() - start
+
+    def _enqueue(self, priority: Priority) -> tuple:
+        ticket = (int(priority), next(self._sequence))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: tuple):
+        # Normally a no-op; cleans up after cancelled or interrupted waiters
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+
+    def _try_acquire(self, ticket: tuple, tokens: int) -> float:
+        """Grant the budget and return 0, or return how long to wait"""
+        with self._lock:
+            if self._queue[0] != ticket:
+                return POLL_INTERVAL
+
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now),
+            )
+            if wait > 0:
+                # Re-check soon in case a higher priority caller shows up
+                return min(wait, POLL_INTERVAL * 5)
+
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            heapq.heappop(self._queue)
+            return 0.0
+
+    def _settle(self, estimated: int, response: Any):
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if actual is None:
+            return
+        with self._lock:
+            if actual < estimated:
+                self.tokens.refund(estimated - actual)
+            else:
+                self.tokens.consume(actual - estimated)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            with self._lock:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+            return retry_after
+
+        # Full jitter keeps a burst of failed callers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def estimate_tokens(request: dict) -> int:
+    """Rough token estimate (~4 characters per token) used for TPM budgeting"""
+    chars = 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+    inputs = request.get("input")
+    if isinstance(inputs, str):
+        chars += len(inputs)
+    elif isinstance(inputs, list):
+        chars += sum(len(text) for text in inputs if isinstance(text, str))
+
+    completion = request.get("max_completion_tokens") or request.get("max_tokens")
+    if completion is None and "messages" in request:
+        completion = 500
+    return chars // 4 + (completion or 0) + 1
+
+
+_default_scheduler: Optional[LLMScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler, configured via OPENAI_RPM and OPENAI_TPM"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler(
+                requests_per_minute=float(os.getenv("OPENAI_RPM", "500")),
+                tokens_per_minute=float(os.getenv("OPENAI_TPM", "200000")),
+            )
+        return _default_scheduler
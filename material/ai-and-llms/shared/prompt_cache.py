@@ -0,0 +1,101 @@
+"""
+Prompt layouts that keep OpenAI's automatic prompt caching effective
+
+The API caches the longest previously seen prefix of a request, in 128-token
+steps once the prompt is at least 1024 tokens long. A cache hit needs a
+byte-identical prefix, so every high-volume call site builds its messages
+from a PromptLayout: static instructions and examples first, assembled once,
+and only then the per-request content. The layout's cache_key (its name
+unless given) is sent as prompt_cache_key, which routes requests with the
+same prefix to the same cache; layouts that extend a common prefix can pass
+the same cache_key to share it.
+
+Each layout also counts prompt and cached tokens from response usage;
+cache_report() summarises the hit ratio per call site.
+
+Usage:
+    FEEDBACK_PROMPT = PromptLayout("feedback-analysis", SYSTEM_PROMPT)
+    response = client.chat.completions.create(
+        model="gpt-4.1",
+        messages=FEEDBACK_PROMPT.messages(feedback_text),
+        prompt_cache_key=FEEDBACK_PROMPT.cache_key,
+    )
+    FEEDBACK_PROMPT.record(response.usage)
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+# Prompts shorter than this are never cached by the API
+MIN_CACHEABLE_TOKENS = 1024
+
+_layouts: Dict[str, "PromptLayout"] = {}
+_layouts_lock = threading.Lock()
+
+
+class PromptLayout:
+    """Byte-stable static prefix followed by variable user content"""
+
+    def __init__(self, name: str, instructions: str, cache_key: Optional[str] = None):
+        self.name = name
+        self.cache_key = cache_key or name
+        # Built once so every request starts with exactly the same bytes
+        self._prefix = ({"role": "system", "content": instructions.strip()},)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        with _layouts_lock:
+            _layouts[name] = self
+
+    @property
+    def prefix_tokens(self) -> int:
+        """Rough size of the static prefix (~4 characters per token)"""
+        return len(self._prefix[0]["content"]) // 4
+
+    @property
+    def cacheable(self) -> bool:
+        return self.prefix_tokens >= MIN_CACHEABLE_TOKENS
+
+    def messages(self, *user_content: str) -> List[dict]:
+        """Static prefix plus one user message per piece of variable content"""
+        return [
+            *self._prefix,
+            *({"role": "user", "content": content} for content in user_content),
+        ]
+
+    def record(self, usage) -> Optional[int]:
+        """Count prompt and cached tokens from response usage; returns cached tokens"""
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += getattr(usage, "prompt_tokens", None) or 0
+            self.cached_tokens += cached
+        return cached
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of prompt tokens served from the cache"""
+        with self._lock:
+            return (
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            )
+
+
+def cache_report() -> str:
+    """One line per layout with its token counts and cache hit ratio"""
+    with _layouts_lock:
+        layouts = sorted(_layouts.values(), key=lambda layout: layout.name)
+
+    lines = []
+    for layout in layouts:
+        note = "" if layout.cacheable else " (prefix below cache minimum)"
+        lines.append(
+            f"{layout.name}: {layout.requests} requests, "
+            f"{layout.cached_tokens}/{layout.prompt_tokens} prompt tokens cached "
+            f"({layout.hit_ratio:.0%}){note}"
+        )
+    return "\n".join(lines)
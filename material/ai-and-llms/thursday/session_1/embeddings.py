@@ -0,0 +1,218 @@
+"""
+Batched, parallel embedding generation with a persistent embedding cache
+
+Texts are looked up in an on-disk cache first, keyed by (model, hash of the
+text). Only the misses are sent to the API: they are split into batches that
+stay under a token budget and an input count limit, and the batches run
+concurrently through the shared rate-limit-aware scheduler. Results always
+come back in input order.
+
+The cache is one append-only float32 file per model, read through np.memmap,
+plus a file of 16-byte text digests giving each row's key. Re-indexing
+unchanged content therefore makes zero API calls, and a 500k-document cache
+opens in well under a second without loading the vectors into RAM.
+
+Usage:
+    service = EmbeddingService(cache_dir=".embedding_cache")
+    vectors = service.embed(texts)  # (len(texts), dim) float32
+"""
+
+import hashlib
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+from openai import OpenAI
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "shared"))
+from llm_scheduler import LLMScheduler, Priority, get_scheduler
+
+DIGEST_SIZE = 16
+
+# API limits are 2048 inputs and 300k tokens per request; stay well below
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 100_000
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()[:DIGEST_SIZE]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped float32 vectors keyed by text digest"""
+
+    def __init__(self, directory: str, model: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.directory / f"{model}.f32"
+        self._keys_path = self.directory / f"{model}.keys"
+        self._meta_path = self.directory / f"{model}.json"
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+
+        if self._meta_path.exists():
+            self.dim = json.loads(self._meta_path.read_text())["dim"]
+            self._load()
+
+    def get(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            vectors = self._vectors
+            rows = [self._rows.get(key) for key in keys]
+        return [None if row is None else vectors[row] for row in rows]
+
+    def put(self, keys: Sequence[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._meta_path.write_text(json.dumps({"dim": self.dim}))
+            # key -> first position in this call; rows are one per key on disk
+            new: Dict[bytes, int] = {}
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in new:
+                    new[key] = i
+            if not new:
+                return
+
+            # Vectors are written before keys, so a crash in between leaves
+            # unreferenced vectors (trimmed on load), never a key without one
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors[list(new.values())].tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new))
+            for key in new:
+                self._rows[key] = len(self._rows)
+            self._map()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        row_bytes = self.dim * 4
+        vector_rows = self._file_size(self._vectors_path) // row_bytes
+        key_rows = self._file_size(self._keys_path) // DIGEST_SIZE
+        rows = min(vector_rows, key_rows)
+        # Drop any partially written tail from an interrupted put()
+        for path, size in [
+            (self._vectors_path, rows * row_bytes),
+            (self._keys_path, rows * DIGEST_SIZE),
+        ]:
+            if path.exists() and self._file_size(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+        if rows:
+            # Sliced by hand: NumPy "S" dtypes would strip trailing zero bytes
+            data = self._keys_path.read_bytes()
+            self._rows = {
+                data[i * DIGEST_SIZE : (i + 1) * DIGEST_SIZE]: i for i in range(rows)
+            }
+        self._map()
+
+    def _map(self):
+        rows = len(self._rows)
+        if rows == 0:
+            self._vectors = np.empty((0, self.dim or 0), dtype=np.float32)
+        else:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+
+    @staticmethod
+    def _file_size(path: Path) -> int:
+        return path.stat().st_size if path.exists() else 0
+
+
+class EmbeddingService:
+    """Cached embeddings, fetched in concurrent token-budgeted batches"""
+
+    def __init__(
+        self,
+        model: str = "text-embedding-3-small",
+        cache_dir: str = ".embedding_cache",
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_batch_inputs: int = MAX_BATCH_INPUTS,
+        max_concurrency: int = 8,
+        client: Optional[OpenAI] = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_concurrency = max_concurrency
+        # Retries and rate limiting are handled by the shared scheduler
+        self.client = client or OpenAI(max_retries=0)
+        self.scheduler = scheduler or get_scheduler()
+        self.cache = EmbeddingCache(cache_dir, model)
+        self.api_calls = 0
+        self.cache_hits = 0
+
+    def embed(
+        self, texts: Sequence[str], priority: Priority = Priority.BATCH
+    ) -> np.ndarray:
+        """(len(texts), dim) float32 embeddings in input order"""
+        keys = [text_digest(text) for text in texts]
+        vectors = self.cache.get(keys)
+        self.cache_hits += sum(vector is not None for vector in vectors)
+
+        # Each distinct missing text is embedded once
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+
+        if missing:
+            pending = list(missing.items())
+            with ThreadPoolExecutor(self.max_concurrency) as pool:
+                fetched = pool.map(
+                    lambda batch: self._embed_batch(batch, priority),
+                    self._batches(pending),
+                )
+                for batch_keys, batch_vectors in fetched:
+                    self.api_calls += 1
+                    self.cache.put(batch_keys, batch_vectors)
+            vectors = self.cache.get(keys)
+
+        if not vectors:
+            return np.empty((0, self.cache.dim or 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    __call__ = embed
+
+    def _batches(self, pending: List[tuple]) -> Iterator[List[tuple]]:
+        batch: List[tuple] = []
+        tokens = 0
+        for key, text in pending:
+            cost = estimate_tokens(text)
+            if batch and (
+                tokens + cost > self.max_batch_tokens
+                or len(batch) >= self.max_batch_inputs
+            ):
+                yield batch
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += cost
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[tuple], priority: Priority) -> tuple:
+        response = self.scheduler.call(
+            self.client.embeddings.create,
+            model=self.model,
+            input=[text for _, text in batch],
+            priority=priority,
+        )
+        # The API may return items out of order; each carries its input index
+        data = sorted(response.data, key=lambda item: item.index)
+        vectors = np.array([item.embedding for item in data], dtype=np.float32)
+        return [key for key, _ in batch], vectors
@@ -0,0 +1,187 @@
+"""
+Hybrid lexical + semantic retrieval (BM25 and reciprocal rank fusion)
+
+Embedding search is good at paraphrases but can miss exact terms such as
+"Kotlin", "FastAPI" or a project name. BM25Index is an inverted index over
+the same documents as the vector index: each posting already holds its BM25
+weight, so a query only gathers the postings of its terms and sums them per
+document, which takes microseconds for the rare terms that matter here.
+
+HybridRetriever runs both searches and merges their rankings with
+reciprocal rank fusion: a document's score is the sum of 1 / (rrf_k + rank)
+over the rankings it appears in. When the lexical result is unambiguous (the
+best document matches most of the query's rare terms and clearly beats the
+runner-up), the vector search and its embedding call are skipped.
+
+Documents are identified by rag_index.content_id on both sides, so BM25 and
+Chroma results refer to the same ids.
+
+Usage:
+    bm25 = BM25Index(documents)
+    retriever = HybridRetriever(bm25, lambda q, n: collection_search(q, n))
+    results = retriever.query("Do you use Kotlin?", n_results=3)
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from rag_index import content_id
+
+_WORD = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its "
+    "me my of on or our that the their there they this to was we what when "
+    "where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _WORD.findall(text.casefold()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index with precomputed BM25 weights per posting"""
+
+    def __init__(
+        self,
+        documents: Sequence[str],
+        ids: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[dict]] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.ids = list(ids) if ids is not None else [content_id(d) for d in documents]
+        self.documents = list(documents)
+        self.metadatas = list(metadatas) if metadatas is not None else None
+
+        counts = [Counter(tokenize(document)) for document in documents]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        norms = k1 * (1 - b + b * lengths / max(average, 1e-9))
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, counter in enumerate(counts):
+            for term, tf in counter.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        n = len(documents)
+        self.idf: Dict[str, float] = {}
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, entries in postings.items():
+            docs = np.array([doc for doc, _ in entries], dtype=np.int32)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.idf[term] = idf
+            weights = idf * tfs * (k1 + 1) / (tfs + norms[docs])
+            self._postings[term] = (docs, weights.astype(np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[int, float]]:
+        """(document index, BM25 score) pairs, best first"""
+        hits = [self._postings[t] for t in set(tokenize(query)) if t in self._postings]
+        if not hits:
+            return []
+        docs = np.concatenate([docs for docs, _ in hits])
+        weights = np.concatenate([weights for _, weights in hits])
+        unique, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+
+        k = min(n_results, len(unique))
+        best = np.argpartition(scores, -k)[-k:]
+        best = best[np.argsort(-scores[best])]
+        return list(zip(unique[best].tolist(), scores[best].tolist()))
+
+    def coverage(self, query: str, document: int) -> float:
+        """Share of the query's IDF mass found in the document"""
+        terms = set(tokenize(query))
+        total = sum(self.idf.get(term, 0.0) for term in terms)
+        if total == 0:
+            return 0.0
+        words = set(tokenize(self.documents[document]))
+        return sum(self.idf.get(term, 0.0) for term in terms & words) / total
+
+
+class HybridRetriever:
+    """BM25 and vector search merged with reciprocal rank fusion"""
+
+    def __init__(
+        self,
+        bm25: BM25Index,
+        vector_search: Callable[[str, int], Dict[str, Any]],
+        rrf_k: int = 60,
+        candidates: int = 20,
+        skip_ratio: float = 2.0,
+        skip_coverage: float = 0.8,
+    ):
+        self.bm25 = bm25
+        # Called as vector_search(query, n_results); returns a Chroma-style result
+        self.vector_search = vector_search
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        # A lexical hit this clear answers the query without embedding it
+        self.skip_ratio = skip_ratio
+        self.skip_coverage = skip_coverage
+        self.vector_skipped = 0
+
+    def query(self, query: str, n_results: int = 3) -> Dict[str, Any]:
+        """Fused results as lists of lists, like a Chroma query result"""
+        lexical = self.bm25.search(query, self.candidates)
+        if self._is_strong(query, lexical):
+            self.vector_skipped += 1
+            ranked = [
+                (self.bm25.ids[doc], self.bm25.documents[doc], self._metadata(doc))
+                for doc, _ in lexical[:n_results]
+            ]
+            scores = [score for _, score in lexical[:n_results]]
+            return self._result(ranked, scores, "lexical")
+
+        semantic = self.vector_search(query, self.candidates)
+        fused: Dict[str, float] = {}
+        found: Dict[str, Tuple[str, Optional[dict]]] = {}
+
+        for rank, (doc, _) in enumerate(lexical):
+            document_id = self.bm25.ids[doc]
+            fused[document_id] = fused.get(document_id, 0.0) + self._rrf(rank)
+            found[document_id] = (self.bm25.documents[doc], self._metadata(doc))
+
+        metadatas = semantic.get("metadatas") or [[None] * len(semantic["ids"][0])]
+        for rank, (document_id, document, metadata) in enumerate(
+            zip(semantic["ids"][0], semantic["documents"][0], metadatas[0])
+        ):
+            fused[document_id] = fused.get(document_id, 0.0) + self._rrf(rank)
+            found.setdefault(document_id, (document, metadata))
+
+        best = sorted(fused, key=fused.get, reverse=True)[:n_results]
+        ranked = [(document_id, *found[document_id]) for document_id in best]
+        return self._result(ranked, [fused[i] for i in best], "hybrid")
+
+    def _is_strong(self, query: str, lexical: List[Tuple[int, float]]) -> bool:
+        if not lexical:
+            return False
+        top = lexical[0][1]
+        runner_up = lexical[1][1] if len(lexical) > 1 else 0.0
+        return (
+            top >= self.skip_ratio * runner_up
+            and self.bm25.coverage(query, lexical[0][0]) >= self.skip_coverage
+        )
+
+    def _rrf(self, rank: int) -> float:
+        return 1 / (self.rrf_k + rank + 1)
+
+    def _metadata(self, doc: int) -> Optional[dict]:
+        return self.bm25.metadatas[doc] if self.bm25.metadatas is not None else None
+
+    @staticmethod
+    def _result(ranked: List[tuple], scores: List[float], source: str) -> dict:
+        return {
+            "ids": [[document_id for document_id, _, _ in ranked]],
+            "documents": [[document for _, document, _ in ranked]],
+            "metadatas": [[metadata for _, _, metadata in ranked]],
+            "scores": [scores],
+            "source": source,
+        }
@@ -0,0 +1,153 @@
+"""
+Two-level answer cache for rag_query
+
+Most questions are repeats, so a cached answer saves both the embedding and
+the chat completion. Lookups try two levels:
+
+1. Exact: the question with case, punctuation and whitespace normalised.
+2. Semantic: the question's embedding against the embeddings of cached
+   questions, accepted above a cosine similarity threshold. Cached
+   embeddings are rows of one preallocated matrix, so this is a single
+   matrix-vector product.
+
+Both only match answers retrieved with the same n_results, since more or
+fewer documents can change the answer, and both return the earlier answer
+together with the documents it was based on.
+Entries expire after a TTL, the oldest entry is replaced when the cache is
+full, and everything is dropped when the index fingerprint (see
+rag_index.sync_collection) changes, since answers may then be out of date.
+
+Usage:
+    cache = AnswerCache(get_embeddings, ttl_seconds=3600)
+    cache.check_index(collection.metadata["fingerprint"])
+    hit = cache.get(question, n_results=3)
+    if hit is None:
+        answer, relevant_qas = rag_query(question, n_results=3)
+        cache.put(question, 3, answer, relevant_qas)
+"""
+
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Literal, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class CachedAnswer(NamedTuple):
+    """A cached rag_query result and how it was matched"""
+
+    answer: str
+    relevant_qas: List[str]
+    match: Literal["exact", "semantic"]
+    similarity: float
+
+
+def normalize_question(question: str) -> str:
+    return _NON_WORD.sub(" ", question.casefold()).strip()
+
+
+class AnswerCache:
+    """Exact and embedding-similarity cache of answers, with TTL"""
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Sequence],
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 10_000,
+    ):
+        self.embed = embed
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.fingerprint: Optional[str] = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # (n_results, normalised question) -> slot
+        self._slots: Dict[Tuple[int, str], int] = {}
+        self._entries: List[Optional[tuple]] = [None] * max_entries
+        # Expiry time per slot; 0 marks a free slot
+        self._expires = np.zeros(max_entries)
+        self._n_results = np.zeros(max_entries, dtype=np.int64)
+        self._vectors: Optional[np.ndarray] = None
+
+    def check_index(self, fingerprint: Optional[str]):
+        """Drop every entry if the index changed since the last check"""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._clear()
+                self.fingerprint = fingerprint
+
+    def get(self, question: str, n_results: int) -> Optional[CachedAnswer]:
+        key = (n_results, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None and self._expires[slot] > now:
+                self.exact_hits += 1
+                answer, relevant_qas = self._entries[slot][1:]
+                return CachedAnswer(answer, relevant_qas, "exact", 1.0)
+            if self._vectors is None or not self._candidates(n_results, now).any():
+                self.misses += 1
+                return None
+
+        vector = self._unit(self.embed([question])[0])
+        with self._lock:
+            similarity = self._vectors @ vector
+            similarity[~self._candidates(n_results, now)] = -1.0
+            slot = int(similarity.argmax())
+            if similarity[slot] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            answer, relevant_qas = self._entries[slot][1:]
+            return CachedAnswer(
+                answer, relevant_qas, "semantic", float(similarity[slot])
+            )
+
+    def put(self, question: str, n_results: int, answer: str, relevant_qas: List[str]):
+        key = (n_results, normalize_question(question))
+        vector = self._unit(self.embed([question])[0])
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), np.float32)
+
+            slot = self._slots.get(key)
+            if slot is None:
+                # A free slot if there is one, otherwise the oldest entry
+                slot = int(self._expires.argmin())
+                if self._entries[slot] is not None:
+                    del self._slots[self._entries[slot][0]]
+                self._slots[key] = slot
+
+            self._entries[slot] = (key, answer, list(relevant_qas))
+            self._vectors[slot] = vector
+            self._n_results[slot] = n_results
+            self._expires[slot] = time.time() + self.ttl_seconds
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int((self._expires > time.time()).sum())
+
+    def _candidates(self, n_results: int, now: float) -> np.ndarray:
+        """Live slots answered with the same n_results"""
+        return (self._expires > now) & (self._n_results == n_results)
+
+    def _clear(self):
+        self._slots.clear()
+        self._entries = [None] * self.max_entries
+        self._expires[:] = 0
+
+    @staticmethod
+    def _unit(vector: Sequence) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,149 @@
+"""
+Persistent, incremental vector index for the RAG knowledge base
+
+Documents are keyed by a hash of their content, so the id of a document only
+changes when its text does. Syncing a collection against the current set of
+documents compares ids only: new or changed documents are embedded and added,
+documents that disappeared are deleted, and everything else is left alone.
+With a chromadb.PersistentClient the embeddings stay on disk, so a restart
+with an unchanged knowledge base makes no embedding calls at all.
+
+After every sync the collection's metadata holds a fingerprint of its ids.
+Anything derived from the index (such as cached answers) can compare
+fingerprints to notice that the index was rebuilt.
+
+Usage:
+    chroma_client = chromadb.PersistentClient(path="rag_index")
+    collection = chroma_client.get_or_create_collection("framna_knowledge")
+    stats = sync_collection(collection, qa_pairs, get_embeddings)
+"""
+
+import hashlib
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+# Ids, deletions and additions are sent to Chroma in batches of this size
+BATCH_SIZE = 5_000
+
+
+class SyncStats(NamedTuple):
+    """What a sync changed, plus the fingerprint of the resulting index"""
+
+    added: int
+    deleted: int
+    unchanged: int
+    fingerprint: str
+
+
+def content_id(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def index_fingerprint(ids: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for document_id in sorted(ids):
+        digest.update(document_id.encode())
+    return digest.hexdigest()[:16]
+
+
+def parse_qa_pairs(text: str) -> List[str]:
+    """One document per question/answer line pair, as the notebook formats them"""
+    qa_pairs = []
+    question = None
+    for line in text.strip().split("\n"):
+        line = line.strip()
+        if line.startswith("Q: "):
+            question = line[3:]
+        elif line.startswith("A: ") and question:
+            qa_pairs.append(f"Q: {question}\nA: {line[3:]}")
+            question = None
+    return qa_pairs
+
+
+def chunk_markdown(text: str, max_chars: int = 1_000) -> List[str]:
+    """
+    Split a Markdown document into chunks along its "## " sections.
+
+    Sections longer than max_chars are split at paragraph boundaries (a
+    single longer paragraph stays whole), and every chunk keeps its section
+    heading so it still makes sense on its own.
+    """
+    chunks = []
+    for section in re.split(r"\n(?=## )", text.strip()):
+        heading, _, body = section.partition("\n")
+        if not body.strip():
+            # A bare title like "# Framna" says nothing by itself
+            continue
+        if len(section) <= max_chars or not heading.startswith("## "):
+            chunks.append(section.strip())
+            continue
+
+        current = heading
+        for paragraph in re.split(r"\n\s*\n", body.strip()):
+            if len(current) + len(paragraph) + 2 > max_chars and current != heading:
+                chunks.append(current)
+                current = heading
+            current += "\n\n" + paragraph
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk]
+
+
+def existing_ids(collection, batch_size: int = BATCH_SIZE) -> Set[str]:
+    """All ids in the collection, fetched page by page without embeddings"""
+    ids: Set[str] = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=batch_size, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < batch_size:
+            return ids
+        offset += batch_size
+
+
+def sync_collection(
+    collection,
+    documents: Sequence[str],
+    embed: Callable[[List[str]], Sequence],
+    metadatas: Optional[Sequence[dict]] = None,
+    batch_size: int = BATCH_SIZE,
+) -> SyncStats:
+    """Make the collection hold exactly `documents`, embedding only new ones"""
+    wanted: Dict[str, int] = {}
+    for i, document in enumerate(documents):
+        # Identical documents collapse into one entry
+        wanted.setdefault(content_id(document), i)
+
+    present = existing_ids(collection, batch_size)
+    removed = sorted(present - wanted.keys())
+    added = [document_id for document_id in wanted if document_id not in present]
+
+    for start in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[start : start + batch_size])
+
+    for start in range(0, len(added), batch_size):
+        ids = added[start : start + batch_size]
+        batch = [documents[wanted[document_id]] for document_id in ids]
+        collection.add(
+            ids=ids,
+            documents=batch,
+            embeddings=embed(batch),
+            metadatas=(
+                [metadatas[wanted[document_id]] for document_id in ids]
+                if metadatas is not None
+                else None
+            ),
+        )
+
+    fingerprint = index_fingerprint(list(wanted))
+    metadata = dict(collection.metadata or {})
+    if metadata.get("fingerprint") != fingerprint:
+        # Chroma refuses to modify the distance function, so leave hnsw:* out
+        metadata = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+        collection.modify(metadata={**metadata, "fingerprint": fingerprint})
+
+    return SyncStats(
+        added=len(added),
+        deleted=len(removed),
+        unchanged=len(wanted) - len(added),
+        fingerprint=fingerprint,
+    )
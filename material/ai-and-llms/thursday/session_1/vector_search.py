@@ -0,0 +1,333 @@
+"""
+In-process NumPy vector search as an alternative to ChromaDB
+
+The knowledge base fits easily in RAM, so embeddings are kept as one
+contiguous matrix of L2-normalised rows. Exact search is a single
+matrix-vector product followed by argpartition for the top k. Rows can be
+stored as float16 or int8 (with a scale per row) to cut memory by 2x or 4x;
+they are scored in blocks, so only one block at a time is widened to
+float32. NumPy has no fast float16/int8 matrix products, so on their own the
+quantised modes trade query speed for memory; combined with IVF they only
+widen the probed lists. int8 widens several times faster than float16, which
+NumPy converts value by value, so exact float16 is the slowest mode by far.
+
+For larger corpora, IVF mode trains a k-means coarse quantiser, stores the
+rows grouped by their nearest centroid, and at query time only scores the
+`nprobe` lists whose centroids are closest to the query.
+
+query() takes and returns the same shapes as collection.query in ChromaDB,
+so it can stand in for a collection in search_knowledge. Distances are cosine
+distances (1 - cosine similarity).
+
+Usage:
+    index = VectorIndex.from_collection(collection, nlist=None)
+    results = index.query(query_embeddings=[embedding], n_results=3)
+
+    python vector_search.py --benchmark 100000
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows widened to float32 at a time when scoring quantised matrices; at 1536
+# dims a block is a 12MB temporary, small enough to stay cache-friendly
+BLOCK_ROWS = 2_048
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(scores, -k)[-k:]
+    return best[np.argsort(-scores[best])]
+
+
+def kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """Spherical k-means on normalised vectors; returns normalised centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=k)
+        # Empty clusters restart from a random vector
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """Exact or IVF cosine-similarity search over an in-memory embedding matrix"""
+
+    def __init__(
+        self,
+        dtype: str = "float32",
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        seed: int = 0,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {list(DTYPES)}")
+        self.dtype = dtype
+        # nlist=None means exact search; nlist=0 picks ~sqrt(n) lists
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+
+        self.ids: List[str] = []
+        self.documents: List[Optional[str]] = []
+        self.metadatas: List[Optional[dict]] = []
+        self._pending: List[np.ndarray] = []
+        self._matrix = np.empty((0, 0), dtype=DTYPES[dtype])
+        self._scales: Optional[np.ndarray] = None
+        self._rows = np.empty(0, dtype=np.int64)
+        self._centroids: Optional[np.ndarray] = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def from_collection(
+        cls, collection, batch_size: int = 5_000, **options
+    ) -> "VectorIndex":
+        """Copy ids, embeddings, documents and metadatas out of a Chroma collection"""
+        index = cls(**options)
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            if len(page["ids"]):
+                index.add(
+                    page["ids"],
+                    page["embeddings"],
+                    page["documents"],
+                    page["metadatas"],
+                )
+            if len(page["ids"]) < batch_size:
+                return index
+            offset += batch_size
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence,
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[dict]] = None,
+    ):
+        self.ids.extend(ids)
+        self.documents.extend(documents if documents is not None else [None] * len(ids))
+        self.metadatas.extend(metadatas if metadatas is not None else [None] * len(ids))
+        self._pending.append(normalize(embeddings))
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def query(
+        self,
+        query_embeddings: Sequence,
+        n_results: int = 10,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, Any]:
+        """Top n_results per query embedding, shaped like Chroma's query result"""
+        self._build()
+        queries = normalize(np.atleast_2d(np.asarray(query_embeddings)))
+
+        if len(self._rows) == 0:
+            # Nothing indexed yet: an empty result list per query, like Chroma
+            matches = [(self._rows, np.empty(0, dtype=np.float32))] * len(queries)
+        elif self._centroids is None:
+            scores = self._scores(slice(None), queries)
+            hits = [(top_k(s, n_results), s) for s in scores.T]
+            matches = [(self._rows[best], s[best]) for best, s in hits]
+        else:
+            matches = [self._search_ivf(query, n_results) for query in queries]
+
+        results: Dict[str, Any] = {"ids": []}
+        for name in include:
+            results[name] = []
+        for rows, similarity in matches:
+            rows = rows.tolist()
+            results["ids"].append([self.ids[row] for row in rows])
+            if "documents" in include:
+                results["documents"].append([self.documents[row] for row in rows])
+            if "metadatas" in include:
+                results["metadatas"].append([self.metadatas[row] for row in rows])
+            if "distances" in include:
+                results["distances"].append((1.0 - similarity).tolist())
+        return results
+
+    def _search_ivf(self, query: np.ndarray, k: int):
+        lists = top_k(self._centroids @ query, self.nprobe)
+        candidates = [
+            np.arange(self._offsets[i], self._offsets[i + 1]) for i in lists.tolist()
+        ]
+        positions = np.concatenate(candidates)
+        scores = self._scores(positions, query[None, :])[:, 0]
+        best = top_k(scores, k)
+        return self._rows[positions[best]], scores[best]
+
+    def _scores(self, positions, queries: np.ndarray) -> np.ndarray:
+        """(rows, queries) cosine similarities for the given matrix positions"""
+        matrix = self._matrix[positions]
+        scales = None if self._scales is None else self._scales[positions]
+        if self.dtype == "float32":
+            return matrix @ queries.T
+
+        scores = np.empty((len(matrix), len(queries)), dtype=np.float32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start : start + BLOCK_ROWS].astype(np.float32)
+            scores[start : start + BLOCK_ROWS] = block @ queries.T
+        if scales is not None:
+            scores *= scales[:, None]
+        return scores
+
+    def _build(self):
+        if not self._pending:
+            return
+        vectors = np.concatenate([self._restore(), *self._pending])
+        self._pending = []
+
+        rows = np.arange(len(vectors))
+        self._centroids = None
+        self._offsets = np.array([0, len(vectors)])
+        if self.nlist is not None and len(vectors):
+            nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+            nlist = min(nlist, len(vectors))
+            # ~64 training points per list is plenty for a coarse quantiser
+            rng = np.random.default_rng(self.seed)
+            sample = vectors[
+                rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)
+            ]
+            self._centroids = kmeans(sample, nlist, seed=self.seed)
+            assignment = (vectors @ self._centroids.T).argmax(axis=1)
+            # Store each list contiguously so probing it is a slice
+            rows = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=nlist)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        self._rows = rows
+        ordered = vectors[rows]
+        if self.dtype == "int8":
+            peak = np.maximum(np.abs(ordered).max(axis=1), 1e-12)
+            self._matrix = np.round(ordered / peak[:, None] * 127).astype(np.int8)
+            self._scales = (peak / 127).astype(np.float32)
+        else:
+            self._matrix = np.ascontiguousarray(ordered, dtype=DTYPES[self.dtype])
+            self._scales = None
+
+    def _restore(self) -> np.ndarray:
+        """Already indexed vectors, widened back to float32 in original order"""
+        if len(self._rows) == 0:
+            return np.empty((0, self._pending[0].shape[1]), dtype=np.float32)
+        vectors = self._matrix.astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[:, None]
+        restored = np.empty_like(vectors)
+        restored[self._rows] = vectors
+        return restored
+
+
+def benchmark(
+    n: int = 100_000,
+    dim: int = 1536,
+    n_queries: int = 200,
+    k: int = 10,
+    seed: int = 0,
+):
+    """Recall@k and queries per second for each mode, and for Chroma if installed"""
+    rng = np.random.default_rng(seed)
+    # Clustered data is closer to real embeddings than uniform noise
+    centers = normalize(rng.normal(size=(256, dim)))
+    labels = rng.integers(0, len(centers), n)
+    vectors = normalize(
+        centers[labels] + rng.normal(scale=0.6 / np.sqrt(dim), size=(n, dim))
+    )
+    queries = normalize(
+        vectors[rng.integers(0, n, n_queries)]
+        + rng.normal(scale=0.6 / np.sqrt(dim), size=(n_queries, dim))
+    )
+    ids = [str(i) for i in range(n)]
+    truth = [set(top_k(s, k).tolist()) for s in (vectors @ queries.T).T]
+
+    def report(name: str, search, build_seconds: float):
+        start = time.perf_counter()
+        found = [search(query) for query in queries]
+        elapsed = time.perf_counter() - start
+        recall = np.mean([len(set(map(int, f)) & t) / k for f, t in zip(found, truth)])
+        print(
+            f"{name:<22} build {build_seconds:6.2f}s  "
+            f"recall@{k} {recall:.3f}  {n_queries / elapsed:8.0f} QPS"
+        )
+
+    modes = [
+        ("exact float32", {}),
+        ("exact float16", {"dtype": "float16"}),
+        ("exact int8", {"dtype": "int8"}),
+        ("ivf float32", {"nlist": 0, "nprobe": 8}),
+        ("ivf int8", {"dtype": "int8", "nlist": 0, "nprobe": 8}),
+    ]
+    print(f"{n:,} vectors x {dim} dims, {n_queries} single-vector queries")
+    for name, options in modes:
+        index = VectorIndex(**options)
+        start = time.perf_counter()
+        index.add(ids, vectors)
+        index._build()
+        build = time.perf_counter() - start
+        report(
+            name,
+            lambda q: index.query([q], k, include=())["ids"][0],
+            build,
+        )
+
+    if chromadb is None:
+        print("chromadb not installed; skipping the Chroma comparison")
+        return
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(
+        "benchmark", metadata={"hnsw:space": "cosine"}
+    )
+    start = time.perf_counter()
+    for i in range(0, n, 5_000):
+        collection.add(ids=ids[i : i + 5_000], embeddings=vectors[i : i + 5_000])
+    build = time.perf_counter() - start
+    report(
+        "chroma hnsw",
+        lambda q: collection.query(query_embeddings=[q], n_results=k, include=[])[
+            "ids"
+        ][0],
+        build,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NumPy vector search")
+    parser.add_argument("--benchmark", type=int, default=100_000, metavar="N")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.benchmark, args.dim, args.queries)
+
+
+if __name__ == "__main__":
+    main()
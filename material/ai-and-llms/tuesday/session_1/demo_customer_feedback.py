@@ -3,30 +3,35 @@ Customer Feedback Analyzer Demo
 Week 1 - Tuesday - Session 1
 """
 
-from typing import List, Literal
-from pydantic import BaseModel, Field
-from openai import OpenAI
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from openai import AsyncOpenAI, OpenAI
+from feedback_models import FeedbackAnalysis, FeedbackBatchAnalysis
 
-client = OpenAI()
+sys.path.append(str(Path(__file__).resolve().parents[2] / "shared"))
+from guardrails import GuardrailEngine
+from llm_scheduler import Priority, get_scheduler
+from prompt_cache import PromptLayout, cache_report
 
+# Retries and rate limiting are handled by the shared scheduler
+client = OpenAI(max_retries=0)
+async_client = AsyncOpenAI(max_retries=0)
+scheduler = get_scheduler()
 
-class CustomerIssue(BaseModel):
-    category: Literal["product", "service", "billing", "technical", "other"]
-    severity: Literal["low", "medium", "high", "critical"]
-    description: str
-    suggested_action: str
+# Clear-cut cases are flagged locally; abusive language still goes to the
+# model, since that feedback usually describes a real issue too
+guardrails = GuardrailEngine(
+    {
+        "violence": ["should burn", "burn down", "burn it down", "kill you"],
+        "security": ["hack into", "hacking into", "steal password", "steal passwords"],
+    }
+)
 
 
-class FeedbackAnalysis(BaseModel):
-    sentiment: Literal["positive", "negative", "neutral"]
-    confidence: float = Field(ge=0.0, le=1.0)
-    issues: List[CustomerIssue]
-    reasoning: str
-    flagged_content: bool
-
-
-def analyze_feedback(feedback_text: str) -> FeedbackAnalysis:
-    system_prompt = """Analyze customer feedback and extract structured information.
+SYSTEM_PROMPT = """Analyze customer feedback and extract structured information.
 
 Examples:
 
@@ -40,26 +45,184 @@ Examples:
     Input: "Your support team is idiots. Fix your billing system!"
     Output: Billing system problems with inappropriate language - flag for review."""
 
+BATCH_INSTRUCTIONS = """
+
+You will receive a JSON list of feedback items, each with an "id" and a
+"text". Analyze every item on its own, exactly as you would a single piece of
+feedback, and return one result per item with the same id."""
+
+# Both layouts start with the few-shot prompt and send one cache key, so
+# single and packed calls can share its cached prefix. At under 200 tokens
+# it is still below the API's 1024-token caching minimum, so nothing is
+# cached yet; packing saves by sending the prompt once per pack instead
+FEEDBACK_PROMPT = PromptLayout("feedback-analysis", SYSTEM_PROMPT)
+FEEDBACK_BATCH_PROMPT = PromptLayout(
+    "feedback-batch",
+    SYSTEM_PROMPT + BATCH_INSTRUCTIONS,
+    cache_key=FEEDBACK_PROMPT.cache_key,
+)
+
+
+def analyze_feedback(feedback_text: str) -> FeedbackAnalysis:
+    blocked = check_guardrails(feedback_text)
+    if blocked:
+        return blocked
+
     try:
-        response = client.beta.chat.completions.parse(
+        response = scheduler.call(
+            client.beta.chat.completions.parse,
             model="gpt-4.1",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": feedback_text},
-            ],
+            messages=FEEDBACK_PROMPT.messages(feedback_text),
             response_format=FeedbackAnalysis,
+            prompt_cache_key=FEEDBACK_PROMPT.cache_key,
+            priority=Priority.INTERACTIVE,
         )
+        FEEDBACK_PROMPT.record(response.usage)
         return response.choices[0].message.parsed
 
     except Exception as e:
-        return FeedbackAnalysis(
-            sentiment="neutral",
-            confidence=0.0,
-            issues=[],
-            reasoning=f"Analysis failed: {e}",
-            flagged_content=True,
+        return failed_analysis(f"Analysis failed: {e}")
+
+
+def analyze_feedback_batch(
+    feedback: Iterable[Tuple[str, str]],
+    pack_size: int = 20,
+    max_pack_chars: int = 8_000,
+    max_concurrency: int = 8,
+) -> Dict[str, FeedbackAnalysis]:
+    """Analyze (id, text) pairs, packing several texts into each request"""
+    return asyncio.run(
+        analyze_feedback_batch_async(
+            feedback, pack_size, max_pack_chars, max_concurrency
+        )
+    )
+
+
+async def analyze_feedback_batch_async(
+    feedback: Iterable[Tuple[str, str]],
+    pack_size: int = 20,
+    max_pack_chars: int = 8_000,
+    max_concurrency: int = 8,
+) -> Dict[str, FeedbackAnalysis]:
+    """
+    Async variant of analyze_feedback_batch; returns analyses keyed by id.
+
+    The few-shot system prompt is sent once per pack instead of once per
+    item. Packs run concurrently, and items a pack fails to return (or all
+    of them, if the pack fails) are retried one by one, so one bad item can't
+    take down its neighbours.
+    """
+    results: Dict[str, Optional[FeedbackAnalysis]] = {}
+    pending: List[Tuple[str, str]] = []
+    for item_id, text in feedback:
+        results[item_id] = check_guardrails(text)
+        if results[item_id] is None:
+            pending.append((item_id, text))
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_single(text: str) -> FeedbackAnalysis:
+        async with semaphore:
+            return await _analyze_single(text)
+
+    async def run_pack(pack: List[Tuple[str, str]]):
+        async with semaphore:
+            analyses = await _analyze_pack(pack)
+        missing = [(item_id, text) for item_id, text in pack if item_id not in analyses]
+        retried = await asyncio.gather(*(run_single(text) for _, text in missing))
+        analyses.update(zip((item_id for item_id, _ in missing), retried))
+        results.update(analyses)
+
+    packs = _pack_feedback(pending, pack_size, max_pack_chars)
+    await asyncio.gather(*(run_pack(pack) for pack in packs))
+    return results
+
+
+def _pack_feedback(
+    items: List[Tuple[str, str]], pack_size: int, max_pack_chars: int
+) -> List[List[Tuple[str, str]]]:
+    packs: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    chars = 0
+    for item in items:
+        if current and (
+            len(current) == pack_size or chars + len(item[1]) > max_pack_chars
+        ):
+            packs.append(current)
+            current, chars = [], 0
+        current.append(item)
+        chars += len(item[1])
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def _analyze_pack(pack: List[Tuple[str, str]]) -> Dict[str, FeedbackAnalysis]:
+    """Analyses for the items the model returned; empty if the request failed"""
+    # Short positional ids keep arbitrary caller ids out of the prompt
+    items = [{"id": str(i), "text": text} for i, (_, text) in enumerate(pack)]
+    try:
+        response = await scheduler.call_async(
+            async_client.beta.chat.completions.parse,
+            model="gpt-4.1",
+            messages=FEEDBACK_BATCH_PROMPT.messages(
+                json.dumps(items, ensure_ascii=False)
+            ),
+            response_format=FeedbackBatchAnalysis,
+            prompt_cache_key=FEEDBACK_BATCH_PROMPT.cache_key,
+            priority=Priority.BATCH,
+        )
+        FEEDBACK_BATCH_PROMPT.record(response.usage)
+        parsed = response.choices[0].message.parsed
+    except Exception:
+        return {}
+    if parsed is None:
+        return {}
+
+    analyses = {}
+    for result in parsed.results:
+        if result.id.isdigit() and int(result.id) < len(pack):
+            analyses.setdefault(pack[int(result.id)][0], result.analysis)
+    return analyses
+
+
+async def _analyze_single(feedback_text: str) -> FeedbackAnalysis:
+    try:
+        response = await scheduler.call_async(
+            async_client.beta.chat.completions.parse,
+            model="gpt-4.1",
+            messages=FEEDBACK_PROMPT.messages(feedback_text),
+            response_format=FeedbackAnalysis,
+            prompt_cache_key=FEEDBACK_PROMPT.cache_key,
+            priority=Priority.BATCH,
+        )
+        FEEDBACK_PROMPT.record(response.usage)
+        return response.choices[0].message.parsed or failed_analysis(
+            "Analysis failed: no result"
         )
 
+    except Exception as e:
+        return failed_analysis(f"Analysis failed: {e}")
+
+
+def check_guardrails(feedback_text: str) -> Optional[FeedbackAnalysis]:
+    """Flagged analysis for feedback caught by the local guardrails, else None"""
+    blocked = guardrails.matches(feedback_text)
+    if not blocked:
+        return None
+    terms = ", ".join(f"'{m.term}' ({m.category})" for m in blocked)
+    return failed_analysis(f"Blocked by guardrails: {terms}")
+
+
+def failed_analysis(reasoning: str) -> FeedbackAnalysis:
+    return FeedbackAnalysis(
+        sentiment="neutral",
+        confidence=0.0,
+        issues=[],
+        reasoning=reasoning,
+        flagged_content=True,
+    )
+
 
 def demo_chain_of_thought():
     complex_feedback = """I've been a customer for 3 years and generally love your
@@ -92,6 +255,23 @@ def demo_safety_guardrails():
         print(f"{status}: {feedback[:30]}...")
 
 
+def demo_batch_analysis():
+    comments = [
+        "Checkout keeps timing out on mobile.",
+        "Fantastic support, my issue was fixed in minutes.",
+        "I was billed twice this month.",
+        "Delivery was on time, thanks!",
+        "The search results are completely irrelevant.",
+    ]
+
+    print("\nBatch analysis demo:")
+    analyses = analyze_feedback_batch(
+        (f"comment-{i}", text) for i, text in enumerate(comments)
+    )
+    for item_id, analysis in analyses.items():
+        print(f"{item_id}: {analysis.sentiment}, {len(analysis.issues)} issues")
+
+
 if __name__ == "__main__":
     print("Customer Feedback Analyzer Demo\n")
 
@@ -103,5 +283,7 @@ if __name__ == "__main__":
 
     demo_chain_of_thought()
     demo_safety_guardrails()
+    demo_batch_analysis()
 
+    print(f"\nPrompt cache:\n{cache_report()}")
     print("\nKey concepts: Few-shot prompting, structured outputs, safety guardrails")
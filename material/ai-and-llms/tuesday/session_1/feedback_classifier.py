@@ -0,0 +1,219 @@
+"""
+Embedding-similarity classifier in front of analyze_feedback
+
+Most feedback is routine praise or one of a few recurring complaints. Past
+FeedbackAnalysis results are grouped by label (sentiment plus the category
+and severity of the main issue), and each label gets a centroid: the
+normalised mean embedding of its examples. New feedback is embedded in
+batches and compared against every centroid with one matrix product. Only
+feedback that is clearly closer to one label than to any other is answered
+locally; everything else goes to the LLM. A local answer carries only the
+label's sentiment, category and severity, never text from the examples.
+
+Usage:
+    classifier = FeedbackClassifier()
+    classifier.fit(past_results)          # [(text, FeedbackAnalysis), ...]
+    analyses = classifier.analyze(texts)  # LLM only for the uncertain ones
+"""
+
+import json
+import sys
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from openai import OpenAI
+from feedback_models import CustomerIssue, FeedbackAnalysis
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "shared"))
+from llm_scheduler import Priority, get_scheduler
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEVERITY_ORDER = ["low", "medium", "high", "critical"]
+
+
+@lru_cache(maxsize=1)
+def openai_client() -> OpenAI:
+    # Created on first use, so a classifier with its own embed needs no API key
+    return OpenAI(max_retries=0)
+
+
+def embed_texts(texts: List[str], batch_size: int = 512) -> np.ndarray:
+    """Unit-length float32 embeddings, one row per text"""
+    rows = []
+    for start in range(0, len(texts), batch_size):
+        response = get_scheduler().call(
+            openai_client().embeddings.create,
+            model=EMBEDDING_MODEL,
+            input=texts[start : start + batch_size],
+            priority=Priority.BATCH,
+        )
+        rows.extend(item.embedding for item in response.data)
+    return normalize(np.array(rows, dtype=np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def main_issue(analysis: FeedbackAnalysis) -> Optional[CustomerIssue]:
+    if not analysis.issues:
+        return None
+    return max(analysis.issues, key=lambda i: SEVERITY_ORDER.index(i.severity))
+
+
+def label_for(analysis: FeedbackAnalysis) -> str:
+    """sentiment, plus category/severity of the most severe issue if any"""
+    issue = main_issue(analysis)
+    if issue is None:
+        return analysis.sentiment
+    return f"{analysis.sentiment}/{issue.category}/{issue.severity}"
+
+
+class FeedbackClassifier:
+    """Nearest-centroid classifier over feedback embeddings"""
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], np.ndarray] = embed_texts,
+        threshold: float = 0.8,
+        margin: float = 0.05,
+        min_examples: int = 5,
+    ):
+        self.embed = embed
+        # Accept a label only if it is similar enough and clearly the best one
+        self.threshold = threshold
+        self.margin = margin
+        self.min_examples = min_examples
+        self.labels: List[str] = []
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.exemplars: List[FeedbackAnalysis] = []
+
+    def fit(self, examples: Iterable[Tuple[str, FeedbackAnalysis]]):
+        """Build centroids from past (text, analysis) results"""
+        texts, labels, analyses = [], [], []
+        for text, analysis in examples:
+            # Flagged or failed analyses are no ground truth to learn from
+            if analysis.flagged_content or analysis.confidence == 0.0:
+                continue
+            texts.append(text)
+            labels.append(label_for(analysis))
+            analyses.append(analysis)
+
+        by_label: Dict[str, List[int]] = defaultdict(list)
+        for i, label in enumerate(labels):
+            by_label[label].append(i)
+        kept = {
+            label: rows
+            for label, rows in by_label.items()
+            if len(rows) >= self.min_examples
+        }
+        if not kept:
+            raise ValueError("Not enough labelled examples to build any centroid")
+
+        embeddings = self.embed([texts[i] for rows in kept.values() for i in rows])
+        self.labels, centroids, self.exemplars = [], [], []
+        offset = 0
+        for label, rows in kept.items():
+            vectors = embeddings[offset : offset + len(rows)]
+            offset += len(rows)
+            centroid = normalize(vectors.mean(axis=0, keepdims=True))[0]
+            # The example closest to the centroid speaks for the whole label
+            exemplar = rows[int((vectors @ centroid).argmax())]
+            self.labels.append(label)
+            centroids.append(centroid)
+            self.exemplars.append(analyses[exemplar])
+        self.centroids = np.stack(centroids)
+
+    def classify(self, texts: List[str]) -> List[Optional[FeedbackAnalysis]]:
+        """Local analysis for each confidently matched text, None for the rest"""
+        if not texts:
+            return []
+        return self.classify_embeddings(self.embed(texts))
+
+    def classify_embeddings(
+        self, embeddings: np.ndarray
+    ) -> List[Optional[FeedbackAnalysis]]:
+        similarities = embeddings @ self.centroids.T
+        if len(self.labels) > 1:
+            top_two = np.partition(similarities, -2, axis=1)[:, -2:]
+            best, runner_up = top_two[:, 1], top_two[:, 0]
+        else:
+            best, runner_up = similarities[:, 0], np.full(len(embeddings), -1.0)
+        best_label = similarities.argmax(axis=1)
+        confident = (best >= self.threshold) & (best - runner_up >= self.margin)
+
+        return [
+            self._local_analysis(int(label), float(score)) if accepted else None
+            for label, score, accepted in zip(best_label, best, confident)
+        ]
+
+    def analyze(self, texts: List[str], **batch_options) -> List[FeedbackAnalysis]:
+        """Classify locally where possible and send the rest to the LLM"""
+        # Only this path needs the LLM analysis, so fit/classify stay demo-free
+        from demo_customer_feedback import analyze_feedback_batch, check_guardrails
+
+        # Guardrails run first so flagged feedback is never matched locally
+        results = [check_guardrails(text) for text in texts]
+        unchecked = [i for i, result in enumerate(results) if result is None]
+        local = self.classify([texts[i] for i in unchecked])
+        for i, result in zip(unchecked, local):
+            results[i] = result
+
+        uncertain = [(str(i), texts[i]) for i, r in enumerate(results) if r is None]
+        if uncertain:
+            analyses = analyze_feedback_batch(uncertain, **batch_options)
+            for item_id, analysis in analyses.items():
+                results[int(item_id)] = analysis
+        return results
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            centroids=self.centroids,
+            labels=np.array(self.labels),
+            exemplars=np.array([a.model_dump_json() for a in self.exemplars]),
+        )
+
+    def load(self, path: str) -> "FeedbackClassifier":
+        data = np.load(path)
+        self.centroids = data["centroids"]
+        self.labels = data["labels"].tolist()
+        self.exemplars = [
+            FeedbackAnalysis.model_validate(json.loads(a)) for a in data["exemplars"]
+        ]
+        return self
+
+    def _local_analysis(self, label: int, similarity: float) -> FeedbackAnalysis:
+        # Only label-level fields are reused: the exemplar's description and
+        # suggested action were written about another customer's feedback
+        exemplar = self.exemplars[label]
+        issue = main_issue(exemplar)
+        issues = []
+        if issue is not None:
+            issues.append(
+                CustomerIssue(
+                    category=issue.category,
+                    severity=issue.severity,
+                    description=(
+                        f"Recurring {issue.category} issue "
+                        f"(matched label '{self.labels[label]}')"
+                    ),
+                    suggested_action=(
+                        f"Follow the standard handling for {issue.severity}-severity "
+                        f"{issue.category} feedback"
+                    ),
+                )
+            )
+        return FeedbackAnalysis(
+            sentiment=exemplar.sentiment,
+            confidence=similarity,
+            issues=issues,
+            reasoning=(
+                f"Matched recurring feedback '{self.labels[label]}' locally "
+                f"(similarity {similarity:.2f})"
+            ),
+            flagged_content=False,
+        )
@@ -0,0 +1,33 @@
+"""
+Data Models for Customer Feedback Analysis
+Week 1 - Tuesday - Session 1
+
+Kept free of API clients so they can be imported without an OPENAI_API_KEY
+"""
+
+from typing import List, Literal
+from pydantic import BaseModel, Field
+
+
+class CustomerIssue(BaseModel):
+    category: Literal["product", "service", "billing", "technical", "other"]
+    severity: Literal["low", "medium", "high", "critical"]
+    description: str
+    suggested_action: str
+
+
+class FeedbackAnalysis(BaseModel):
+    sentiment: Literal["positive", "negative", "neutral"]
+    confidence: float = Field(ge=0.0, le=1.0)
+    issues: List[CustomerIssue]
+    reasoning: str
+    flagged_content: bool
+
+
+class FeedbackItemAnalysis(BaseModel):
+    id: str
+    analysis: FeedbackAnalysis
+
+
+class FeedbackBatchAnalysis(BaseModel):
+    results: List[FeedbackItemAnalysis]
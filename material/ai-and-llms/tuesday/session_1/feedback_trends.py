@@ -0,0 +1,202 @@
+"""
+Streaming trend statistics over FeedbackAnalysis results
+
+Each window is a ring of fixed-size time buckets holding issue counts by
+(category, severity) and feedback counts by sentiment, plus running totals
+over the whole ring. Observing an analysis adds to the current bucket and the
+totals; when time moves past a bucket, its counts are subtracted from the
+totals and the bucket is reused. Memory per window is fixed by the number of
+buckets, and every query is a lookup in the totals.
+
+Windows are accurate to one bucket: with the default 60 buckets, a 15-minute
+window covers the last 15 minutes in 15-second steps.
+
+Usage:
+    trends = FeedbackTrends()
+    trends.observe(analysis)
+    trends.issue_count("billing", "critical", window=900)
+    trends.sentiment_rate("negative", window=3600)
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, get_args
+import numpy as np
+from feedback_models import CustomerIssue, FeedbackAnalysis
+
+CATEGORIES = get_args(CustomerIssue.model_fields["category"].annotation)
+SEVERITIES = get_args(CustomerIssue.model_fields["severity"].annotation)
+SENTIMENTS = get_args(FeedbackAnalysis.model_fields["sentiment"].annotation)
+
+_CATEGORY = {name: i for i, name in enumerate(CATEGORIES)}
+_SEVERITY = {name: i for i, name in enumerate(SEVERITIES)}
+_SENTIMENT = {name: i for i, name in enumerate(SENTIMENTS)}
+
+
+class SlidingWindow:
+    """Bucketed counts over the last window_seconds"""
+
+    def __init__(self, window_seconds: float, buckets: int = 60):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self._issues = np.zeros((buckets, len(CATEGORIES), len(SEVERITIES)), np.int64)
+        self._sentiments = np.zeros((buckets, len(SENTIMENTS)), np.int64)
+        self._flagged = np.zeros(buckets, np.int64)
+        self.issues = np.zeros((len(CATEGORIES), len(SEVERITIES)), np.int64)
+        self.sentiments = np.zeros(len(SENTIMENTS), np.int64)
+        self.flagged = 0
+        self._current: Optional[int] = None
+
+    def add(self, analysis: FeedbackAnalysis, timestamp: float):
+        bucket = int(timestamp // self.bucket_seconds)
+        self.advance(timestamp)
+        # Too old for the window (only possible for late, out-of-order input)
+        if bucket <= self._current - self.buckets:
+            return
+        slot = bucket % self.buckets
+
+        if analysis.flagged_content:
+            self._flagged[slot] += 1
+            self.flagged += 1
+            return
+        sentiment = _SENTIMENT[analysis.sentiment]
+        self._sentiments[slot, sentiment] += 1
+        self.sentiments[sentiment] += 1
+        for issue in analysis.issues:
+            key = (_CATEGORY[issue.category], _SEVERITY[issue.severity])
+            self._issues[(slot, *key)] += 1
+            self.issues[key] += 1
+
+    def advance(self, now: float):
+        """Expire the buckets that have left the window by now"""
+        bucket = int(now // self.bucket_seconds)
+        if self._current is None:
+            self._current = bucket
+            return
+        if bucket <= self._current:
+            return
+
+        # Past a full lap every bucket is expired; no need to visit any twice
+        for expired in range(
+            self._current + 1, min(bucket, self._current + self.buckets) + 1
+        ):
+            slot = expired % self.buckets
+            self.issues -= self._issues[slot]
+            self.sentiments -= self._sentiments[slot]
+            self.flagged -= int(self._flagged[slot])
+            self._issues[slot] = 0
+            self._sentiments[slot] = 0
+            self._flagged[slot] = 0
+        self._current = bucket
+
+
+class TrendAlert(NamedTuple):
+    """Fires when at least `threshold` matching issues fall within the window"""
+
+    name: str
+    window: float
+    threshold: int
+    category: Optional[str] = None
+    severity: Optional[str] = None
+
+
+DEFAULT_ALERTS = [
+    TrendAlert("critical-billing-15m", 900, 3, "billing", "critical"),
+    TrendAlert("critical-any-15m", 900, 10, severity="critical"),
+]
+
+
+class FeedbackTrends:
+    """Sliding-window issue and sentiment statistics for several window sizes"""
+
+    def __init__(
+        self,
+        windows: Iterable[float] = (300, 900, 3600),
+        buckets: int = 60,
+        alerts: Iterable[TrendAlert] = DEFAULT_ALERTS,
+    ):
+        self.alerts = list(alerts)
+        sizes = set(windows) | {alert.window for alert in self.alerts}
+        self._windows: Dict[float, SlidingWindow] = {
+            size: SlidingWindow(size, buckets) for size in sorted(sizes)
+        }
+        self._lock = threading.Lock()
+
+    def observe(self, analysis: FeedbackAnalysis, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for window in self._windows.values():
+                window.add(analysis, timestamp)
+
+    def observe_many(
+        self, analyses: Iterable[FeedbackAnalysis], timestamp: Optional[float] = None
+    ):
+        for analysis in analyses:
+            self.observe(analysis, timestamp)
+
+    def issue_count(
+        self,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        window: float = 900,
+        now: Optional[float] = None,
+    ) -> int:
+        """Issues in the window, optionally limited to a category and/or severity"""
+        rows = slice(None) if category is None else _CATEGORY[category]
+        columns = slice(None) if severity is None else _SEVERITY[severity]
+        with self._lock:
+            issues = self._window(window, now).issues
+            return int(issues[rows, columns].sum())
+
+    def feedback_count(self, window: float = 900, now: Optional[float] = None) -> int:
+        """Analysed (not flagged) feedback in the window"""
+        with self._lock:
+            return int(self._window(window, now).sentiments.sum())
+
+    def flagged_count(self, window: float = 900, now: Optional[float] = None) -> int:
+        with self._lock:
+            return self._window(window, now).flagged
+
+    def sentiment_rate(
+        self,
+        sentiment: str = "negative",
+        window: float = 900,
+        now: Optional[float] = None,
+    ) -> float:
+        """Share of analysed feedback in the window with the given sentiment"""
+        with self._lock:
+            sentiments = self._window(window, now).sentiments
+            total = int(sentiments.sum())
+            return int(sentiments[_SENTIMENT[sentiment]]) / total if total else 0.0
+
+    def triggered_alerts(self, now: Optional[float] = None) -> List[TrendAlert]:
+        return [
+            alert
+            for alert in self.alerts
+            if self.issue_count(alert.category, alert.severity, alert.window, now)
+            >= alert.threshold
+        ]
+
+    def summary(self, window: float = 900, now: Optional[float] = None) -> str:
+        with self._lock:
+            current = self._window(window, now)
+            issues = current.issues.copy()
+            total = int(current.sentiments.sum())
+            negative = int(current.sentiments[_SENTIMENT["negative"]])
+            flagged = current.flagged
+
+        lines = [
+            f"Last {window / 60:g} min: {total} analysed, {flagged} flagged, "
+            f"{negative / total if total else 0.0:.0%} negative"
+        ]
+        for c, s in zip(*np.nonzero(issues)):
+            lines.append(f"  {CATEGORIES[c]}/{SEVERITIES[s]}: {issues[c, s]}")
+        return "\n".join(lines)
+
+    def _window(self, size: float, now: Optional[float]) -> SlidingWindow:
+        window = self._windows.get(size)
+        if window is None:
+            raise ValueError(f"No {size}s window; configured: {sorted(self._windows)}")
+        window.advance(time.time() if now is None else now)
+        return window
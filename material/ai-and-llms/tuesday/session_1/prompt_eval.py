@@ -0,0 +1,406 @@
+"""
+Evaluation harness comparing prompting strategies
+
+Runs every strategy (zero-shot, few-shot, chain-of-thought, ...) over the same
+labelled dataset, concurrently and through the shared rate-limit scheduler,
+and records per strategy: accuracy, prompt and completion tokens, latency
+percentiles, retries and cost. Latency covers only the API call that
+succeeded: time queued in the scheduler and failed attempts with their
+backoff are left out, and retries are counted separately. The comparison is
+written as a Markdown report plus the raw per-example results as JSON.
+
+A strategy turns an input text into a prompt, and each task pairs a dataset
+and its strategies with a scorer:
+
+- sentiment: the answer's last "Answer: <label>" line (or its last line if
+  there is none) must match the expected label.
+- summary: the summarisation prompts from compare_approaches in
+  prompting_patterns_examples.py; the summary (the answer's last line) must
+  mention every expected keyword.
+
+Usage:
+    python prompt_eval.py --model gpt-4.1-mini --repeats 3 --out eval_report.md
+    python prompt_eval.py --task summary --out summary_report.md
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "shared"))
+from llm_scheduler import Priority, get_scheduler
+from prompting_patterns_examples import compare_approaches
+
+async_client = AsyncOpenAI(max_retries=0)
+scheduler = get_scheduler()
+
+# USD per 1M tokens: (input, output)
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+LABELS = ["positive", "negative", "neutral"]
+
+# (feedback, expected sentiment)
+SENTIMENT_DATASET: List[Tuple[str, str]] = [
+    ("Fantastic support, my issue was fixed in minutes.", "positive"),
+    ("I was billed twice this month and nobody answers my emails.", "negative"),
+    ("Delivery was on time, thanks!", "positive"),
+    ("The search results are completely irrelevant.", "negative"),
+    ("I changed my shipping address yesterday.", "neutral"),
+    ("The delivery was late but the product quality is excellent!", "positive"),
+    ("Great price, shame the app crashes every time I open my cart.", "negative"),
+    ("Do you ship to Norway?", "neutral"),
+    ("Not bad, not great. It does what it says.", "neutral"),
+    ("Third broken charger in two months. I want a refund.", "negative"),
+    ("Love the new dark mode!", "positive"),
+    ("The package arrived. I haven't opened it yet.", "neutral"),
+]
+
+ANSWER_FORMAT = (
+    f"End with a final line 'Answer: <label>', where label is one of: "
+    f"{', '.join(LABELS)}."
+)
+
+
+def zero_shot(text: str) -> str:
+    return f"""Classify the sentiment of this customer feedback.
+{ANSWER_FORMAT}
+
+Feedback: {text}"""
+
+
+def few_shot(text: str) -> str:
+    return f"""Classify the sentiment of customer feedback.
+{ANSWER_FORMAT}
+
+Feedback: "The app is fast and the checkout is so easy."
+Answer: positive
+
+Feedback: "My order was cancelled without any explanation."
+Answer: negative
+
+Feedback: "Can I change the colour after ordering?"
+Answer: neutral
+
+Feedback: {text}"""
+
+
+def chain_of_thought(text: str) -> str:
+    return f"""Classify the sentiment of this customer feedback. Think step by step:
+
+1. List the positive and negative statements
+2. Decide which one dominates the customer's overall experience
+3. If there are neither, the feedback is neutral
+
+{ANSWER_FORMAT}
+
+Feedback: {text}"""
+
+
+STRATEGIES: Dict[str, Callable[[str], str]] = {
+    "zero_shot": zero_shot,
+    "few_shot": few_shot,
+    "chain_of_thought": chain_of_thought,
+}
+
+# (text, comma-separated keywords a faithful summary must mention)
+SUMMARY_DATASET: List[Tuple[str, str]] = [
+    (
+        "Our support team now answers chat messages around the clock, and "
+        "average response times dropped from four hours to ten minutes.",
+        "support, minutes",
+    ),
+    (
+        "The spring sale runs until Sunday: all running shoes are 30% off, and "
+        "orders over 500 SEK ship for free.",
+        "sale, shoes, free",
+    ),
+    (
+        "A faulty payment update caused some customers to be charged twice on "
+        "Monday. All duplicate charges have been refunded.",
+        "charged twice, refund",
+    ),
+    (
+        "The mobile app adds dark mode, offline access to order history and "
+        "faster checkout in version 5.2.",
+        "dark mode, offline",
+    ),
+    (
+        "Due to a storm, deliveries to northern Sweden are delayed by up to three "
+        "days. Tracking links will update once parcels are moving again.",
+        "storm, delay",
+    ),
+]
+
+
+def strategies_from(
+    compare: Callable[[str], Dict[str, str]],
+) -> Dict[str, Callable[[str], str]]:
+    """Strategies from a compare_approaches-style text -> {name: prompt} function"""
+    return {name: lambda text, name=name: compare(text)[name] for name in compare("")}
+
+
+SUMMARY_STRATEGIES = strategies_from(compare_approaches)
+
+
+class ExampleResult(BaseModel):
+    """Outcome of one strategy on one dataset example"""
+
+    strategy: str
+    text: str
+    expected: str
+    predicted: Optional[str]
+    correct: bool
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_seconds: float = 0.0
+    retries: int = 0
+    error: Optional[str] = None
+
+
+class StrategyReport(BaseModel):
+    """Aggregated results for one strategy"""
+
+    strategy: str
+    examples: int
+    errors: int
+    accuracy: float
+    prompt_tokens: int
+    completion_tokens: int
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    retries: int
+    cost_usd: float
+
+
+def parse_answer(answer: str) -> Optional[str]:
+    """Label from the last 'Answer:' line, or from the last line"""
+    # Models like to bold the final line ("**Answer:** positive")
+    answer = answer.replace("*", "")
+    lines = [line.strip() for line in answer.splitlines() if line.strip()]
+    if not lines:
+        return None
+    answer_lines = [line for line in lines if line.lower().startswith("answer:")]
+    final = answer_lines[-1].split(":", 1)[1] if answer_lines else lines[-1]
+    words = final.strip(" .'\"").lower().split()
+    return words[0] if words else None
+
+
+def score_label(answer: str, expected: str) -> Tuple[Optional[str], bool]:
+    predicted = parse_answer(answer)
+    return predicted, predicted == expected
+
+
+def score_keywords(answer: str, expected: str) -> Tuple[Optional[str], bool]:
+    """The summary is the answer's last line; it must contain every keyword"""
+    lines = [line.strip() for line in answer.splitlines() if line.strip()]
+    if not lines:
+        return None, False
+    summary = lines[-1].removeprefix("Summary:").strip()
+    keywords = [k.strip().lower() for k in expected.split(",")]
+    return summary, all(k in summary.lower() for k in keywords)
+
+
+# name -> (dataset, strategies, scorer)
+TASKS = {
+    "sentiment": (SENTIMENT_DATASET, STRATEGIES, score_label),
+    "summary": (SUMMARY_DATASET, SUMMARY_STRATEGIES, score_keywords),
+}
+
+
+def cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+async def run_example(
+    strategy: str,
+    build_prompt: Callable[[str], str],
+    text: str,
+    expected: str,
+    model: str,
+    semaphore: asyncio.Semaphore,
+    score: Callable[[str, str], Tuple[Optional[str], bool]] = score_label,
+) -> ExampleResult:
+    latency = 0.0
+    retries = 0
+
+    async def timed_create(**kwargs):
+        # Timed per attempt, so the last value is the call that succeeded
+        nonlocal latency
+        start = time.perf_counter()
+        try:
+            return await async_client.chat.completions.create(**kwargs)
+        finally:
+            latency = time.perf_counter() - start
+
+    def record_retry(attempt: int, delay: float):
+        nonlocal retries
+        retries = attempt
+
+    async with semaphore:
+        try:
+            response = await scheduler.call_async(
+                timed_create,
+                model=model,
+                messages=[{"role": "user", "content": build_prompt(text)}],
+                temperature=0,
+                priority=Priority.BATCH,
+                on_retry=record_retry,
+            )
+        except Exception as e:
+            return ExampleResult(
+                strategy=strategy,
+                text=text,
+                expected=expected,
+                predicted=None,
+                correct=False,
+                retries=retries,
+                error=str(e),
+            )
+
+    predicted, correct = score(response.choices[0].message.content or "", expected)
+    usage = response.usage
+    return ExampleResult(
+        strategy=strategy,
+        text=text,
+        expected=expected,
+        predicted=predicted,
+        correct=correct,
+        prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+        latency_seconds=latency,
+        retries=retries,
+    )
+
+
+async def evaluate_async(
+    dataset: List[Tuple[str, str]],
+    strategies: Dict[str, Callable[[str], str]] = STRATEGIES,
+    model: str = "gpt-4.1-mini",
+    repeats: int = 1,
+    max_concurrency: int = 16,
+    score: Callable[[str, str], Tuple[Optional[str], bool]] = score_label,
+) -> List[ExampleResult]:
+    """Run every strategy on every example `repeats` times, concurrently"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(
+        *(
+            run_example(name, build_prompt, text, expected, model, semaphore, score)
+            for _ in range(repeats)
+            for name, build_prompt in strategies.items()
+            for text, expected in dataset
+        )
+    )
+
+
+def evaluate(
+    dataset: List[Tuple[str, str]],
+    strategies: Dict[str, Callable[[str], str]] = STRATEGIES,
+    model: str = "gpt-4.1-mini",
+    repeats: int = 1,
+    max_concurrency: int = 16,
+    score: Callable[[str, str], Tuple[Optional[str], bool]] = score_label,
+) -> List[ExampleResult]:
+    return asyncio.run(
+        evaluate_async(dataset, strategies, model, repeats, max_concurrency, score)
+    )
+
+
+def summarize(results: List[ExampleResult], model: str) -> List[StrategyReport]:
+    by_strategy: Dict[str, List[ExampleResult]] = {}
+    for result in results:
+        by_strategy.setdefault(result.strategy, []).append(result)
+
+    reports = []
+    for strategy, items in by_strategy.items():
+        latencies = [r.latency_seconds for r in items if r.error is None]
+        p50, p95, p99 = (
+            np.percentile(latencies, [50, 95, 99]) if latencies else (0, 0, 0)
+        )
+        prompt_tokens = sum(r.prompt_tokens for r in items)
+        completion_tokens = sum(r.completion_tokens for r in items)
+        reports.append(
+            StrategyReport(
+                strategy=strategy,
+                examples=len(items),
+                errors=sum(r.error is not None for r in items),
+                accuracy=sum(r.correct for r in items) / len(items),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                latency_p50=float(p50),
+                latency_p95=float(p95),
+                latency_p99=float(p99),
+                retries=sum(r.retries for r in items),
+                cost_usd=cost(model, prompt_tokens, completion_tokens),
+            )
+        )
+    return reports
+
+
+def format_report(reports: List[StrategyReport], model: str) -> str:
+    lines = [
+        f"# Prompting strategy comparison ({model})",
+        "",
+        "| Strategy | Accuracy | Errors | Tokens in | Tokens out "
+        "| p50 (s) | p95 (s) | p99 (s) | Retries | Cost (USD) | Cost / correct |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in sorted(reports, key=lambda r: -r.accuracy):
+        correct = round(r.accuracy * r.examples)
+        per_correct = f"{r.cost_usd / correct:.6f}" if correct else "-"
+        lines.append(
+            f"| {r.strategy} | {r.accuracy:.1%} | {r.errors} | {r.prompt_tokens} "
+            f"| {r.completion_tokens} | {r.latency_p50:.2f} | {r.latency_p95:.2f} "
+            f"| {r.latency_p99:.2f} | {r.retries} | {r.cost_usd:.6f} | {per_correct} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_report(results: List[ExampleResult], model: str, path: str) -> str:
+    """Write the Markdown comparison to path and raw results next to it"""
+    report = format_report(summarize(results, model), model)
+    out = Path(path)
+    out.write_text(report)
+    out.with_suffix(".json").write_text(
+        json.dumps([r.model_dump() for r in results], indent=2)
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompting strategies")
+    parser.add_argument("--task", choices=list(TASKS), default="sentiment")
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--out", default="eval_report.md")
+    args = parser.parse_args()
+
+    dataset, strategies, score = TASKS[args.task]
+    results = evaluate(
+        dataset,
+        strategies,
+        model=args.model,
+        repeats=args.repeats,
+        max_concurrency=args.concurrency,
+        score=score,
+    )
+    print(write_report(results, args.model, args.out))
+
+
+if __name__ == "__main__":
+    main()
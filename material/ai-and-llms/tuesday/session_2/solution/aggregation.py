@@ -0,0 +1,364 @@
+"""
+Vectorised expense aggregation across many receipts
+
+Line items are the fact table: every row holds its amount in int64 cents,
+dictionary-encoded merchant, currency and category codes, and the transaction
+day. A group-by is a single np.add.at over dense integer keys, so totals stay
+exact and millions of line items aggregate in well under a second.
+
+Totals are always split by currency (amounts in different currencies are
+never added up) and are pre-tax, since tax isn't itemised per line. A line
+item's category comes from the receipt's expense_categories entry listing its
+description. Those entries aren't always the bare description (the rule
+parser writes "3x Cappuccino", the model writes free text), so both sides are
+normalised and a quantity prefix is ignored. Failing an exact match, an
+entry containing every word of the description is used.
+
+The benchmark times the vectorised group-bys over synthetic columns, and
+add_receipt over receipts produced by parse_receipt, checking that the
+category totals come out equal to the receipts' own expense_categories.
+
+Usage:
+    python aggregation.py results_dir/
+    python aggregation.py --benchmark 10000000 --receipts 200000
+"""
+
+import argparse
+import itertools
+import random
+import re
+import time
+from array import array
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List
+import numpy as np
+from export import iter_result_files, to_cents
+from models import ExpenseTotal, Receipt
+from receipt_parser import parse_receipt
+
+UNCATEGORIZED = "Uncategorized"
+EPOCH = date(1970, 1, 1)
+
+_QUANTITY_PREFIX = re.compile(r"^\s*\d+\s*[x×*]\s*", re.I)
+_NON_WORD = re.compile(r"[\W_]+")
+
+# Column name -> (array typecode for buffering, NumPy dtype)
+COLUMNS = {
+    "amount_cents": ("q", np.int64),
+    "merchant": ("i", np.int32),
+    "currency": ("i", np.int32),
+    "category": ("i", np.int32),
+    "day": ("q", np.int64),
+}
+
+
+# The same few thousand product names recur across receipts
+@lru_cache(maxsize=65_536)
+def item_key(description: str) -> str:
+    """Description without quantity prefix, case or punctuation"""
+    return _NON_WORD.sub(" ", _QUANTITY_PREFIX.sub("", description).lower()).strip()
+
+
+class Vocabulary:
+    """Dictionary encoding from strings to dense integer codes"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ExpenseAggregator:
+    """Accumulates line items as NumPy columns and computes group-by totals"""
+
+    def __init__(self, chunk_size: int = 1_000_000):
+        self.merchants = Vocabulary()
+        self.currencies = Vocabulary()
+        self.categories = Vocabulary()
+        self.chunk_size = chunk_size
+        # Rows from add_receipt are buffered in compact arrays, then frozen
+        # into NumPy chunks
+        self._pending = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self._chunks: List[Dict[str, np.ndarray]] = []
+
+    def add_receipt(self, receipt: Receipt):
+        merchant = self.merchants.encode(receipt.merchant_name)
+        currency = self.currencies.encode(receipt.currency)
+        day = (receipt.transaction_date - EPOCH).days
+        category_of = {
+            item_key(item): self.categories.encode(category.category)
+            for category in receipt.expense_categories
+            for item in category.items
+        }
+
+        pending = self._pending
+        for item in receipt.line_items:
+            category = self._category_for(item_key(item.description), category_of)
+            pending["amount_cents"].append(to_cents(item.total_price))
+            pending["merchant"].append(merchant)
+            pending["currency"].append(currency)
+            pending["category"].append(category)
+            pending["day"].append(day)
+
+        if len(pending["amount_cents"]) >= self.chunk_size:
+            self._flush()
+
+    def _category_for(self, key: str, category_of: Dict[str, int]) -> int:
+        category = category_of.get(key)
+        if category is None and key:
+            # Free-text entries like "Cappuccino Large (3 cups)"; whole words
+            # only, so "tea" doesn't match "steak"
+            words = set(key.split())
+            category = next(
+                (
+                    code
+                    for item, code in category_of.items()
+                    if words <= set(item.split())
+                ),
+                None,
+            )
+        if category is None:
+            category = self.categories.encode(UNCATEGORIZED)
+        return category
+
+    def add_receipts(self, receipts: Iterable[Receipt]):
+        for receipt in receipts:
+            self.add_receipt(receipt)
+
+    def add_arrays(self, **columns: np.ndarray):
+        """Append already encoded columns (codes from this aggregator's vocabularies)"""
+        self._flush()
+        self._chunks.append(
+            {
+                name: np.asarray(columns[name], dtype=dtype)
+                for name, (_, dtype) in COLUMNS.items()
+            }
+        )
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """All line items as one set of NumPy columns"""
+        self._flush()
+        if not self._chunks:
+            return {name: np.empty(0, dtype) for name, (_, dtype) in COLUMNS.items()}
+        if len(self._chunks) > 1:
+            self._chunks = [
+                {
+                    name: np.concatenate([chunk[name] for chunk in self._chunks])
+                    for name in COLUMNS
+                }
+            ]
+        return self._chunks[0]
+
+    def by_category(self) -> List[ExpenseTotal]:
+        columns = self.columns()
+        return self._group(
+            columns, columns["category"], self.categories.values.__getitem__
+        )
+
+    def by_merchant(self) -> List[ExpenseTotal]:
+        columns = self.columns()
+        return self._group(
+            columns, columns["merchant"], self.merchants.values.__getitem__
+        )
+
+    def by_currency(self) -> List[ExpenseTotal]:
+        columns = self.columns()
+        return self._group(
+            columns, columns["currency"], self.currencies.values.__getitem__
+        )
+
+    def by_day(self) -> List[ExpenseTotal]:
+        columns = self.columns()
+        days = columns["day"]
+        first = int(days.min()) if len(days) else 0
+        return self._group(
+            columns,
+            days - first,
+            lambda offset: str(np.datetime64(first + offset, "D")),
+        )
+
+    def _group(
+        self,
+        columns: Dict[str, np.ndarray],
+        codes: np.ndarray,
+        label: Callable[[int], str],
+    ) -> List[ExpenseTotal]:
+        if len(codes) == 0:
+            return []
+
+        # Dense composite key per (group, currency); no sorting needed
+        currencies = len(self.currencies)
+        keys = codes.astype(np.int64) * currencies + columns["currency"]
+        size = (int(codes.max()) + 1) * currencies
+
+        totals = np.zeros(size, dtype=np.int64)
+        np.add.at(totals, keys, columns["amount_cents"])
+        counts = np.bincount(keys, minlength=size)
+
+        return [
+            ExpenseTotal(
+                key=label(key // currencies),
+                currency=self.currencies.values[key % currencies],
+                total_cents=int(totals[key]),
+                item_count=int(counts[key]),
+            )
+            for key in np.flatnonzero(counts).tolist()
+        ]
+
+    def _flush(self):
+        if not self._pending["amount_cents"]:
+            return
+        self._chunks.append(
+            {
+                name: np.frombuffer(self._pending[name], dtype=dtype).copy()
+                for name, (_, dtype) in COLUMNS.items()
+            }
+        )
+        self._pending = {name: array(code) for name, (code, _) in COLUMNS.items()}
+
+
+def benchmark(n_items: int = 10_000_000, seed: int = 0):
+    """Time every group-by over n_items synthetic line items"""
+    rng = np.random.default_rng(seed)
+    aggregator = ExpenseAggregator()
+    for i in range(5_000):
+        aggregator.merchants.encode(f"Merchant {i}")
+    for currency in ["SEK", "EUR", "USD", "NOK", "DKK"]:
+        aggregator.currencies.encode(currency)
+    for i in range(12):
+        aggregator.categories.encode(f"Category {i}")
+
+    start = time.perf_counter()
+    aggregator.add_arrays(
+        amount_cents=rng.integers(100, 500_000, n_items),
+        merchant=rng.integers(0, len(aggregator.merchants), n_items),
+        currency=rng.integers(0, len(aggregator.currencies), n_items),
+        category=rng.integers(0, len(aggregator.categories), n_items),
+        day=rng.integers(19_000, 19_365, n_items),
+    )
+    print(f"Generated {n_items:,} line items in {time.perf_counter() - start:.2f}s")
+
+    expected = int(aggregator.columns()["amount_cents"].sum())
+    for name in ["by_category", "by_merchant", "by_currency", "by_day"]:
+        start = time.perf_counter()
+        groups = getattr(aggregator, name)()
+        elapsed = time.perf_counter() - start
+        total = sum(group.total_cents for group in groups)
+        if total != expected:
+            raise RuntimeError(f"{name} totals {total} cents, expected {expected}")
+        print(f"{name}: {len(groups):,} groups in {elapsed:.2f}s")
+
+
+PRODUCTS = [
+    "Cappuccino Large",
+    "Herbal Tea",
+    "Sourdough Bread",
+    "Yoga Mat",
+    "Vitamin D Supplement",
+    "Dish Soap",
+    "AA Battery Pack",
+    "Board Game",
+    "Paperback Book",
+]
+
+
+def synthetic_receipt_text(rng: random.Random, store: int) -> str:
+    """A receipt in the layout parse_receipt understands"""
+    lines = [f"STORE {store}", f"March {rng.randint(1, 28)}, 2024 - 12:00", ""]
+    subtotal = 0
+    for product in rng.sample(PRODUCTS, rng.randint(1, 6)):
+        quantity, price = rng.randint(1, 4), rng.randint(10, 400)
+        subtotal += quantity * price
+        lines.append(f"{quantity}x {product}    {quantity * price} SEK")
+    tax = subtotal / 4
+    lines += ["", f"Subtotal: {subtotal} SEK", f"VAT (25%): {tax:.2f} SEK"]
+    lines.append(f"Total: {subtotal + tax:.2f} SEK")
+    return "\n".join(lines)
+
+
+def benchmark_receipts(n_receipts: int = 200_000, distinct: int = 2_000, seed: int = 0):
+    """Time add_receipt on parse_receipt output and check its category totals"""
+    rng = random.Random(seed)
+    parsed = [
+        parse_receipt(synthetic_receipt_text(rng, i % 50)) for i in range(distinct)
+    ]
+    if any(receipt is None for receipt in parsed):
+        raise RuntimeError("parse_receipt rejected a synthetic receipt")
+    receipts = list(itertools.islice(itertools.cycle(parsed), n_receipts))
+    n_items = sum(len(receipt.line_items) for receipt in receipts)
+
+    aggregator = ExpenseAggregator()
+    start = time.perf_counter()
+    aggregator.add_receipts(receipts)
+    aggregator.columns()
+    elapsed = time.perf_counter() - start
+    print(
+        f"add_receipt: {n_receipts:,} receipts ({n_items:,} line items) in "
+        f"{elapsed:.2f}s, {elapsed / n_items * 1e6:.2f}us per line item"
+    )
+
+    expected: Dict[str, int] = {}
+    for receipt in receipts:
+        for category in receipt.expense_categories:
+            expected[category.category] = expected.get(category.category, 0) + to_cents(
+                category.total_amount
+            )
+    totals = {group.key: group.total_cents for group in aggregator.by_category()}
+    if totals != expected:
+        raise RuntimeError(f"Category totals {totals} don't match {expected}")
+    print(f"Category totals match expense_categories: {totals}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate extracted receipts")
+    parser.add_argument("results_dir", nargs="?", help="Directory of *.result.json")
+    parser.add_argument("--benchmark", type=int, metavar="N_ITEMS")
+    parser.add_argument(
+        "--receipts",
+        type=int,
+        metavar="N_RECEIPTS",
+        help="Also time add_receipt over N parsed receipts",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark or args.receipts:
+        if args.benchmark:
+            benchmark(args.benchmark)
+        if args.receipts:
+            benchmark_receipts(args.receipts)
+        return
+    if not args.results_dir:
+        parser.error("results_dir is required unless --benchmark is given")
+
+    aggregator = ExpenseAggregator()
+    aggregator.add_receipts(
+        result.document
+        for _, result in iter_result_files(args.results_dir)
+        if result.was_successful()
+    )
+    for title, groups in [
+        ("Category", aggregator.by_category()),
+        ("Merchant", aggregator.by_merchant()),
+        ("Currency", aggregator.by_currency()),
+        ("Day", aggregator.by_day()),
+    ]:
+        print(f"\nBy {title.lower()}:")
+        for group in sorted(groups, key=lambda g: (g.currency, -g.total_cents)):
+            print(
+                f"  {group.key:<30} {group.currency} {group.total_amount:>14} "
+                f"({group.item_count} items)"
+            )
+
+
+if __name__ == "__main__":
+    main()
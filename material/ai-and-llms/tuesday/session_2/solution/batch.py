@@ -0,0 +1,269 @@
+"""
+Batch API submission mode for non-interactive extraction workloads
+
+Requests are written to JSONL shards, uploaded and submitted through the
+OpenAI Batch endpoint, polled until done and parsed back into
+ExtractionResult objects. Every step is checkpointed in state.json inside
+the work directory, so re-running a job after a crash picks up where it left
+off instead of paying for the same batch twice.
+"""
+
+import json
+import os
+import time
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Tuple
+from models import ExtractionResult, get_response_format, validate_document_json
+
+if TYPE_CHECKING:
+    from extractor import DocumentExtractor
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchExtractionJob:
+    """Resumable Batch API job for one document type"""
+
+    def __init__(
+        self,
+        extractor: "DocumentExtractor",
+        work_dir: str,
+        document_type: str = "receipt",
+        max_requests_per_batch: int = 50_000,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+    ):
+        self.extractor = extractor
+        self.client = extractor.client
+        self.work_dir = Path(work_dir)
+        self.document_type = document_type
+        self.max_requests_per_batch = max_requests_per_batch
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.state_path = self.work_dir / "state.json"
+        self.state = self._load_state()
+
+    def run(
+        self, documents: Iterable[Tuple[str, str]]
+    ) -> Iterator[Tuple[str, ExtractionResult]]:
+        """
+        Run the whole job for (custom_id, text) pairs and yield results.
+
+        Results are yielded at least once: a shard, and likewise the documents
+        answered locally, is only marked as collected after all of its results
+        were consumed, so a crash mid-way replays just that part on the next run.
+        """
+        if not self.state["shards"]:
+            self.write_requests(documents)
+
+        for shard in self.state["shards"]:
+            self._submit_shard(shard)
+
+        for shard in self.state["shards"]:
+            if shard.get("collected"):
+                continue
+            self._wait_for_shard(shard)
+            yield from self._collect_shard(shard)
+            shard["collected"] = True
+            self._save_state()
+
+        if not self.state.get("local_collected"):
+            yield from self._local_results()
+            self.state["local_collected"] = True
+            self._save_state()
+
+    def write_requests(self, documents: Iterable[Tuple[str, str]]):
+        """Write Batch API request shards and record them in the job state"""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        model_class = self.extractor._get_model_class(self.document_type)
+        response_format = get_response_format(model_class)
+
+        shards = []
+        documents = iter(documents)
+        local_path = self.work_dir / "local_results.jsonl"
+        with open(local_path, "w") as local:
+            while True:
+                shard_path = self.work_dir / f"requests_{len(shards):04d}.jsonl"
+                count = 0
+                with open(f"{shard_path}.tmp", "w") as f:
+                    for custom_id, text in documents:
+                        # Never pay for requests we can answer or reject locally
+                        result = self._local_result(text)
+                        if result:
+                            record = {"custom_id": custom_id, "result": result}
+                            local.write(json.dumps(record) + "\n")
+                            continue
+
+                        body = self.extractor._build_request(text, self.document_type)
+                        body["response_format"] = response_format
+                        line = {
+                            "custom_id": custom_id,
+                            "method": "POST",
+                            "url": "/v1/chat/completions",
+                            "body": body,
+                        }
+                        f.write(json.dumps(line) + "\n")
+                        count += 1
+                        if count == self.max_requests_per_batch:
+                            break
+
+                if count == 0:
+                    os.remove(f"{shard_path}.tmp")
+                    break
+                os.replace(f"{shard_path}.tmp", shard_path)
+                shards.append({"requests_file": shard_path.name, "count": count})
+
+        self.state["shards"] = shards
+        # Every request names this model; kept for results read after a restart
+        self.state["model"] = self.extractor.model
+        self._save_state()
+
+    def _submit_shard(self, shard: dict):
+        if not shard.get("input_file_id"):
+            with open(self.work_dir / shard["requests_file"], "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="batch")
+            shard["input_file_id"] = uploaded.id
+            self._save_state()
+
+        if not shard.get("batch_id"):
+            # A crash between create() and _save_state() must not double-submit
+            batch = self._find_batch(shard["input_file_id"])
+            if batch is None:
+                batch = self.client.batches.create(
+                    input_file_id=shard["input_file_id"],
+                    endpoint="/v1/chat/completions",
+                    completion_window=self.completion_window,
+                    metadata={"requests_file": shard["requests_file"]},
+                )
+            shard["batch_id"] = batch.id
+            shard["status"] = batch.status
+            self._save_state()
+
+    def _find_batch(self, input_file_id: str):
+        for batch in islice(self.client.batches.list(limit=100), 1000):
+            if batch.input_file_id == input_file_id:
+                return batch
+        return None
+
+    def _wait_for_shard(self, shard: dict):
+        while shard.get("status") not in TERMINAL_STATUSES:
+            batch = self.client.batches.retrieve(shard["batch_id"])
+            shard["status"] = batch.status
+            shard["output_file_id"] = batch.output_file_id
+            shard["error_file_id"] = batch.error_file_id
+            if batch.status == "failed" and batch.errors:
+                shard["errors"] = [e.message for e in batch.errors.data or []]
+            self._save_state()
+
+            if batch.status not in TERMINAL_STATUSES:
+                time.sleep(self.poll_interval)
+
+    def _collect_shard(self, shard: dict) -> Iterator[Tuple[str, ExtractionResult]]:
+        seen = set()
+        for key in ("output_file_id", "error_file_id"):
+            if not shard.get(key):
+                continue
+            path = self.work_dir / f"{shard['requests_file']}.{key}.jsonl"
+            if not path.exists():
+                self._download(shard[key], path)
+
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        custom_id, result = self._parse_output_line(json.loads(line))
+                        seen.add(custom_id)
+                        yield custom_id, result
+
+        # Requests that never made it into an output file (failed or expired batch)
+        if len(seen) < shard["count"]:
+            reason = "; ".join(shard.get("errors", [])) or f"Batch {shard['status']}"
+            with open(self.work_dir / shard["requests_file"]) as f:
+                for line in f:
+                    custom_id = json.loads(line)["custom_id"]
+                    if custom_id not in seen:
+                        yield custom_id, ExtractionResult(
+                            success=False, error_message=reason
+                        )
+
+    def _download(self, file_id: str, path: Path):
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            response.stream_to_file(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    def _parse_output_line(self, line: dict) -> Tuple[str, ExtractionResult]:
+        custom_id = line["custom_id"]
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or response.get("body", {}).get("error") or {}
+            return custom_id, ExtractionResult(
+                success=False,
+                error_message=error.get("message", "Batch request failed"),
+            )
+
+        try:
+            body = response["body"]
+            message = body["choices"][0]["message"]
+            if message.get("refusal"):
+                raise ValueError(f"Model refused: {message['refusal']}")
+
+            model_class = self.extractor._get_model_class(self.document_type)
+            document = validate_document_json(model_class, message["content"])
+            usage = body.get("usage") or {}
+            model = self.state.get("model")
+            models = self.extractor.router.models
+            return custom_id, ExtractionResult(
+                success=True,
+                document=document,
+                tokens_used=usage.get("total_tokens"),
+                model=model,
+                model_tier=models.index(model) if model in models else None,
+                confidence_score=getattr(document, "extraction_confidence", 0.0),
+                fields_extracted=self.extractor._count_extracted_fields(document),
+            )
+
+        except Exception as e:
+            return custom_id, ExtractionResult(success=False, error_message=str(e))
+
+    def _local_result(self, text: str) -> Optional[dict]:
+        error = self.extractor._validate_request(text, self.document_type)
+        if error:
+            result = ExtractionResult(success=False, error_message=error)
+            return result.model_dump(mode="json")
+
+        document = self.extractor._parse_locally(text, self.document_type)
+        if document is None:
+            return None
+
+        result = ExtractionResult(
+            success=True,
+            document=document,
+            tokens_used=0,
+            confidence_score=getattr(document, "extraction_confidence", 0.0),
+            fields_extracted=self.extractor._count_extracted_fields(document),
+            extraction_method="rules",
+        )
+        return result.model_dump(mode="json")
+
+    def _local_results(self) -> Iterator[Tuple[str, ExtractionResult]]:
+        path = self.work_dir / "local_results.jsonl"
+        if not path.exists():
+            return
+        with open(path) as f:
+            for line in f:
+                local = json.loads(line)
+                yield local["custom_id"], ExtractionResult.model_validate(
+                    local["result"]
+                )
+
+    def _load_state(self) -> dict:
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"document_type": self.document_type, "shards": []}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,371 @@
+"""
+Local stand-in for the OpenAI Files and Batch endpoints
+
+Implements just what BatchExtractionJob uses: file upload, batch create,
+retrieve and list, and file content download. Batches move from validating
+to in_progress to completed over a few retrieve calls. Every request is then
+answered with a fixed valid receipt, except requests whose text contains
+FAIL, which end up in the error file. State is kept in memory, and the
+server counts uploads and created batches so double submissions show up.
+
+The resume scenario runs a job against the stand-in and stops consuming
+results after three of them, as if the process had crashed. It then forgets
+one shard's batch id, as if the process had died right after
+batches.create, and runs the job again from the work directory. Each run
+should upload every shard and create every batch exactly once, deliver every
+document, and leave nothing for a third run.
+
+Usage:
+    python batch_server.py --resume-demo
+    python batch_server.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=x python main.py
+"""
+
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from benchmark import FAKE_RECEIPT
+
+
+class BatchStandIn:
+    """In-memory files and batches; a batch completes after a few retrieves"""
+
+    def __init__(self, polls_until_done: int = 2, fail_marker: str = "FAIL"):
+        self.polls_until_done = polls_until_done
+        self.fail_marker = fail_marker
+        self.files: Dict[str, dict] = {}
+        self.contents: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+        self.uploads = 0
+        self.batches_created = 0
+        self._polls: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def upload(self, filename: str, purpose: str, content: bytes) -> dict:
+        with self._lock:
+            self.uploads += 1
+            return self._store_file(filename, purpose, content)
+
+    def create_batch(self, request: dict) -> dict:
+        with self._lock:
+            if request["input_file_id"] not in self.files:
+                raise KeyError(request["input_file_id"])
+            self.batches_created += 1
+            batch_id = f"batch_{next(self._ids)}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "metadata": request.get("metadata"),
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "errors": None,
+            }
+            self._polls[batch_id] = 0
+            return self.batches[batch_id]
+
+    def retrieve_batch(self, batch_id: str) -> dict:
+        with self._lock:
+            batch = self.batches[batch_id]
+            self._polls[batch_id] += 1
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+            elif (
+                batch["status"] == "in_progress"
+                and self._polls[batch_id] >= self.polls_until_done
+            ):
+                self._complete(batch)
+            return batch
+
+    def list_batches(self, limit: int, after: Optional[str]) -> dict:
+        with self._lock:
+            # Newest first, like the real endpoint
+            batches = list(reversed(self.batches.values()))
+            if after:
+                ids = [batch["id"] for batch in batches]
+                batches = batches[ids.index(after) + 1 :]
+            page = batches[:limit]
+            return {
+                "object": "list",
+                "data": page,
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+                "has_more": len(batches) > limit,
+            }
+
+    def _complete(self, batch: dict):
+        output: List[str] = []
+        errors: List[str] = []
+        for line in self.contents[batch["input_file_id"]].decode().splitlines():
+            request = json.loads(line)
+            body = request["body"]
+            text = body["messages"][-1]["content"]
+            if self.fail_marker in text:
+                errors.append(self._error_line(request["custom_id"]))
+            else:
+                output.append(self._output_line(request["custom_id"], body["model"]))
+
+        if output:
+            batch["output_file_id"] = self._store_file(
+                "output.jsonl", "batch_output", "\n".join(output).encode()
+            )["id"]
+        if errors:
+            batch["error_file_id"] = self._store_file(
+                "errors.jsonl", "batch_output", "\n".join(errors).encode()
+            )["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    def _output_line(self, custom_id: str, model: str) -> str:
+        completion = {
+            "id": f"chatcmpl-{custom_id}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": json.dumps(FAKE_RECEIPT),
+                        "refusal": None,
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 400,
+                "completion_tokens": 150,
+                "total_tokens": 550,
+            },
+        }
+        return json.dumps(
+            {
+                "id": f"batch_req_{custom_id}",
+                "custom_id": custom_id,
+                "response": {"status_code": 200, "body": completion},
+                "error": None,
+            }
+        )
+
+    def _error_line(self, custom_id: str) -> str:
+        return json.dumps(
+            {
+                "id": f"batch_req_{custom_id}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 400,
+                    "body": {
+                        "error": {
+                            "message": "Rejected by the stand-in server",
+                            "type": "invalid_request_error",
+                        }
+                    },
+                },
+                "error": None,
+            }
+        )
+
+    def _store_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.contents[file_id] = content
+        return self.files[file_id]
+
+
+def serve(standin: BatchStandIn, port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stand-in on 127.0.0.1 from a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            path = urlparse(self.path).path
+            if path == "/v1/files":
+                fields = self._form_fields(body)
+                self._reply(
+                    standin.upload(
+                        fields["file"][0],
+                        fields["purpose"][1].decode(),
+                        fields["file"][1],
+                    )
+                )
+            elif path == "/v1/batches":
+                try:
+                    self._reply(standin.create_batch(json.loads(body)))
+                except KeyError:
+                    self._reply({"error": {"message": "No such file"}}, 404)
+            else:
+                self._reply({"error": {"message": f"Unknown path {path}"}}, 404)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            try:
+                if parts == ["v1", "batches"]:
+                    query = parse_qs(url.query)
+                    limit = int(query.get("limit", ["20"])[0])
+                    after = query.get("after", [None])[0]
+                    self._reply(standin.list_batches(limit, after))
+                elif parts[:2] == ["v1", "batches"] and len(parts) == 3:
+                    self._reply(standin.retrieve_batch(parts[2]))
+                elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+                    self._send(
+                        200, "application/octet-stream", standin.contents[parts[2]]
+                    )
+                else:
+                    self._reply({"error": {"message": f"Unknown path {url.path}"}}, 404)
+            except KeyError:
+                self._reply({"error": {"message": "Not found"}}, 404)
+
+        def _form_fields(self, body: bytes) -> Dict[str, tuple]:
+            """name -> (filename, content) for a multipart/form-data body"""
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            message = BytesParser(policy=default_policy).parsebytes(header + body)
+            return {
+                part.get_param("name", header="content-disposition"): (
+                    part.get_filename(),
+                    part.get_payload(decode=True),
+                )
+                for part in message.iter_parts()
+            }
+
+        def _reply(self, payload: dict, status: int = 200):
+            self._send(status, "application/json", json.dumps(payload).encode())
+
+        def _send(self, status: int, content_type: str, body: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def resume_demo(n_documents: int = 12, per_batch: int = 4):
+    """Crash a job part-way through, resume it, and check nothing is lost or repeated"""
+    standin = BatchStandIn()
+    server = serve(standin)
+    # Read by the SDK when DocumentExtractor creates its clients
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    from batch import BatchExtractionJob
+    from extractor import DocumentExtractor
+
+    documents = [
+        (
+            f"receipt-{i:02d}",
+            f"CORNER SHOP\nOrder {i}\nCoffee {i + 20} SEK\nPaid by card",
+        )
+        for i in range(n_documents)
+    ]
+    documents[1] = ("receipt-01", "too short")  # rejected locally
+    documents[2] = ("receipt-02", documents[2][1] + "\nFAIL")  # rejected by the server
+    documents[3] = (
+        "receipt-03",
+        "CORNER SHOP RECEIPT\nMarch 16, 2024 - 14:32\n\n3x Cappuccino Large  78 SEK\n\n"
+        "Subtotal: 78 SEK\nVAT (25%): 19.50 SEK\nTotal: 97.50 SEK",
+    )  # answered by the rule parser
+
+    def job() -> BatchExtractionJob:
+        return BatchExtractionJob(
+            DocumentExtractor(openai_api_key="stand-in"),
+            work_dir,
+            max_requests_per_batch=per_batch,
+            poll_interval=0.01,
+        )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        first = []
+        for custom_id, _ in job().run(documents):
+            first.append(custom_id)
+            if len(first) == 3:
+                break  # the simulated crash
+        state_path = Path(work_dir) / "state.json"
+        state = json.loads(state_path.read_text())
+        del state["shards"][-1]["batch_id"]
+        state_path.write_text(json.dumps(state))
+
+        second = dict(job().run([]))
+        third = list(job().run([]))
+        shards = len(state["shards"])
+
+    server.shutdown()
+    methods = {}
+    for result in second.values():
+        methods[result.extraction_method] = methods.get(result.extraction_method, 0) + 1
+    models = {result.model for result in second.values() if result.success}
+    print(f"First run:  {len(first)} results, then stopped")
+    print(f"Second run: {len(second)} results, methods {methods}, models {models}")
+    print(f"Third run:  {len(third)} results")
+    print(
+        f"Server: {standin.uploads} uploads and {standin.batches_created} batches "
+        f"for {shards} shards"
+    )
+
+    problems = []
+    if set(second) | set(first) != {custom_id for custom_id, _ in documents}:
+        problems.append("some documents were never delivered")
+    if third:
+        problems.append("a finished job delivered results again")
+    if standin.uploads != shards or standin.batches_created != shards:
+        problems.append("a shard was uploaded or submitted twice")
+    if problems:
+        raise SystemExit("Resume demo failed: " + "; ".join(problems))
+    print("Resume demo passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Files/Batch API stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--resume-demo",
+        action="store_true",
+        help="Run the crash-and-resume scenario against a private server and exit",
+    )
+    args = parser.parse_args()
+
+    if args.resume_demo:
+        resume_demo()
+        return
+    server = serve(BatchStandIn(), args.port)
+    print(f"Serving on http://127.0.0.1:{server.server_port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
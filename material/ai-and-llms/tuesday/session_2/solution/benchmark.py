@@ -0,0 +1,297 @@
+"""
+Extraction throughput against a local fake chat-completions server, and
+micro-benchmarks of the model hot path
+
+A stdlib HTTP server on 127.0.0.1 answers every /chat/completions request
+with the same valid receipt after a random delay around --latency. The real
+SDK client, connection pool, scheduler, routing and validation all run, but
+model latency is fixed and nothing is billed. extract_many is timed at each
+concurrency level; with latency L the ceiling is concurrency / L documents
+per second. The server runs in the same process, so at high concurrency both
+sides compete for the interpreter and the numbers are a lower bound.
+
+With --models, the per-document work in models.py is timed instead over
+synthetic receipts: validating the JSON, serialising the result, counting
+fields and building the response_format, each next to the slower way it
+replaced.
+
+Usage:
+    python benchmark.py --documents 500 --latency 0.2 --concurrency 1 8 32
+    python benchmark.py --models 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Sequence
+import numpy as np
+from models import (
+    Receipt,
+    count_populated_fields,
+    get_response_format,
+    validate_document_json,
+)
+from routing import ModelRouter
+
+sys.path.append(str(Path(__file__).resolve().parents[3] / "shared"))
+from llm_scheduler import LLMScheduler
+
+FAKE_RECEIPT = {
+    "transaction_date": "2024-03-16",
+    "merchant_name": "Fake Mart",
+    "line_items": [
+        {
+            "description": "Cappuccino Large",
+            "quantity": 3,
+            "unit_price": "26.00",
+            "total_price": "78.00",
+        }
+    ],
+    "subtotal": "78.00",
+    "tax_rate": 25.0,
+    "tax_amount": "19.50",
+    "total_amount": "97.50",
+    "currency": "SEK",
+    "payment_method": "card",
+    "card_last_four": "1234",
+    "expense_categories": [
+        {
+            "category": "Food & Beverage",
+            "total_amount": "78.00",
+            "item_count": 1,
+            "items": ["Cappuccino Large"],
+        }
+    ],
+    "extraction_confidence": 0.95,
+}
+
+
+def fake_completions_server(latency: float) -> ThreadingHTTPServer:
+    """Start a chat-completions stand-in on a free local port"""
+    content = json.dumps(FAKE_RECEIPT)
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so the client's connection pool is exercised
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; Nagle would delay the body
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency * random.uniform(0.5, 1.5))
+            body = json.dumps(
+                {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {
+                                "role": "assistant",
+                                "content": content,
+                                "refusal": None,
+                            },
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 400,
+                        "completion_tokens": 150,
+                        "total_tokens": 550,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # The default listen backlog of 5 drops connections at high concurrency
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_receipts(n: int) -> List[str]:
+    # Every text is distinct, so nothing could be answered from a cache
+    return [
+        f"FAKE MART #{i}\nMarch 16, 2024\n3x Cappuccino Large  78 SEK\n"
+        f"Order {i:06d}\nTotal: 97.50 SEK"
+        for i in range(n)
+    ]
+
+
+async def run_extract_many(extractor, texts: Sequence[str], concurrency: int):
+    latencies = []
+    failed = 0
+    documents = ((text, "receipt") for text in texts)
+    async for _, result in extractor.extract_many(documents, concurrency):
+        latencies.append(result.processing_time)
+        failed += not result.success
+    return latencies, failed
+
+
+def benchmark(
+    n_documents: int = 500,
+    latency: float = 0.2,
+    concurrency_levels: Sequence[int] = (1, 8, 32),
+):
+    """Documents per second through extract_many at each concurrency level"""
+    server = fake_completions_server(latency)
+    # Read by the SDK when DocumentExtractor creates its clients
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    from extractor import DocumentExtractor
+
+    texts = synthetic_receipts(n_documents)
+    print(
+        f"{n_documents} receipts, fake model latency {latency * 1000:.0f}ms "
+        f"(+/-50%), server on port {server.server_port}"
+    )
+    try:
+        for concurrency in concurrency_levels:
+            extractor = DocumentExtractor(
+                openai_api_key="benchmark",
+                max_concurrency=concurrency,
+                use_rule_parser=False,
+                # Unlimited budgets: this measures the client, not rate limits
+                scheduler=LLMScheduler(requests_per_minute=1e9, tokens_per_minute=1e12),
+                router=ModelRouter(["fake-model"]),
+            )
+            start = time.perf_counter()
+            latencies, failed = asyncio.run(
+                run_extract_many(extractor, texts, concurrency)
+            )
+            elapsed = time.perf_counter() - start
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(
+                f"concurrency {concurrency:>4}: {n_documents / elapsed:8.1f} docs/s "
+                f"(ceiling {concurrency / latency:8.1f})  "
+                f"p50 {p50 * 1000:6.0f}ms  p95 {p95 * 1000:6.0f}ms  failed {failed}"
+            )
+    finally:
+        server.shutdown()
+
+
+def synthetic_receipt_json(n: int, seed: int = 0) -> List[str]:
+    """Valid Receipt JSON documents with 1-40 line items each"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(n):
+        items = []
+        for j in range(rng.randint(1, 40)):
+            quantity = rng.randint(1, 5)
+            unit_cents = rng.randint(100, 50_000)
+            items.append(
+                {
+                    "description": f"Item {j} of receipt {i}",
+                    "quantity": quantity,
+                    "unit_price": f"{unit_cents / 100:.2f}",
+                    "total_price": f"{quantity * unit_cents / 100:.2f}",
+                }
+            )
+        subtotal_cents = sum(round(float(item["total_price"]) * 100) for item in items)
+        tax_cents = subtotal_cents // 4
+        documents.append(
+            json.dumps(
+                {
+                    **FAKE_RECEIPT,
+                    "receipt_number": str(i),
+                    "line_items": items,
+                    "subtotal": f"{subtotal_cents / 100:.2f}",
+                    "tax_amount": f"{tax_cents / 100:.2f}",
+                    "total_amount": f"{(subtotal_cents + tax_cents) / 100:.2f}",
+                    "expense_categories": [],
+                }
+            )
+        )
+    return documents
+
+
+def benchmark_models(n_receipts: int = 5_000):
+    """Per-receipt cost of each models.py hot-path helper and what it replaced"""
+    documents = synthetic_receipt_json(n_receipts)
+    receipts = [validate_document_json(Receipt, d) for d in documents]
+    items = sum(len(receipt.line_items) for receipt in receipts)
+    print(f"{n_receipts:,} synthetic receipts, {items:,} line items")
+
+    def report(name: str, func: Callable, inputs: Sequence):
+        start = time.perf_counter()
+        for value in inputs:
+            func(value)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<44} {elapsed / len(inputs) * 1e6:9.1f} us/call")
+
+    report(
+        "validate: json.loads + model_validate",
+        lambda d: Receipt.model_validate(json.loads(d)),
+        documents,
+    )
+    report(
+        "validate: validate_document_json",
+        lambda d: validate_document_json(Receipt, d),
+        documents,
+    )
+    report(
+        "serialize: json.dumps(model_dump(mode=json))",
+        lambda r: json.dumps(r.model_dump(mode="json")),
+        receipts,
+    )
+    report("serialize: model_dump_json", lambda r: r.model_dump_json(), receipts)
+    report(
+        "fields: model_dump",
+        lambda r: sum(v is not None for v in r.model_dump().values()),
+        receipts,
+    )
+    report("fields: count_populated_fields", count_populated_fields, receipts)
+    # Schema generation is slow, so the uncached variant gets fewer calls
+    report(
+        "schema: built per request",
+        lambda _: get_response_format.__wrapped__(Receipt),
+        range(min(n_receipts, 200)),
+    )
+    report(
+        "schema: get_response_format (cached)",
+        lambda _: get_response_format(Receipt),
+        range(n_receipts),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark extract_many against a fake chat-completions server"
+    )
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--models",
+        type=int,
+        metavar="N_RECEIPTS",
+        help="Time the models.py hot path over N synthetic receipts instead",
+    )
+    args = parser.parse_args()
+    if args.models:
+        benchmark_models(args.models)
+        return
+    benchmark(args.documents, args.latency, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Response cache for structured extraction calls
+
+Responses are content-addressed: the key is a hash of the model, the full
+message list, the response schema and the temperature, so any prompt or
+schema change naturally misses the cache.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import List, Optional, Protocol, Tuple, Type
+from pydantic import BaseModel
+
+
+class ResponseCache(Protocol):
+    """Interface DocumentExtractor expects from a cache backend"""
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[int]]]: ...
+
+    def set(self, key: str, document_json: str, tokens_used: Optional[int]): ...
+
+
+@lru_cache(maxsize=None)
+def _schema_fingerprint(response_format: Type[BaseModel]) -> str:
+    schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()
+
+
+def make_cache_key(
+    model: str,
+    messages: List[dict],
+    response_format: Type[BaseModel],
+    temperature: float,
+) -> str:
+    payload = json.dumps(
+        [model, messages, _schema_fingerprint(response_format), temperature],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SQLiteResponseCache:
+    """On-disk LRU cache with TTL, backed by a single SQLite file"""
+
+    def __init__(
+        self,
+        path: str = "extraction_cache.sqlite3",
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[float] = 30 * 24 * 3600,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL + NORMAL sync keeps hits and LRU touches off the fsync path
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                document_json TEXT NOT NULL,
+                tokens_used INTEGER,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access "
+            "ON responses (last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[int]]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document_json, tokens_used, created_at "
+                "FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            document_json, tokens_used, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._size -= 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return document_json, tokens_used
+
+    def set(self, key: str, document_json: str, tokens_used: Optional[int]):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO responses "
+                "(key, document_json, tokens_used, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, document_json, tokens_used, now, now),
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "UPDATE responses SET document_json = ?, tokens_used = ?, "
+                    "created_at = ?, last_access = ? WHERE key = ?",
+                    (document_json, tokens_used, now, now, key),
+                )
+            else:
+                self._size += 1
+
+            if self._size > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _evict(self, now: float):
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (now - self.ttl_seconds,),
+            )
+        # Evict down to 90% so we don't pay for a DELETE on every insert
+        target = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_access LIMIT "
+            "MAX(0, (SELECT COUNT(*) FROM responses) - ?))",
+            (target,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
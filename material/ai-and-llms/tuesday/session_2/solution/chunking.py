@@ -0,0 +1,108 @@
+"""
+Chunked extraction helpers for oversized documents
+
+Long documents are split at line boundaries, each chunk is extracted into a
+ReceiptChunk independently (map), and merge_receipt_chunks combines them into
+one Receipt (reduce). Amounts are recomputed from the merged line items rather
+than trusted from any single chunk, and the Receipt validators run again on
+the merged result.
+"""
+
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from models import ExpenseCategory, Receipt, ReceiptChunk
+
+HEADER_FIELDS = [
+    "receipt_number",
+    "transaction_date",
+    "transaction_time",
+    "merchant_name",
+    "merchant_location",
+    "currency",
+    "payment_method",
+    "card_last_four",
+    "tax_rate",
+]
+
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars without breaking lines"""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+
+    for line in text.splitlines():
+        # A single overlong line still becomes its own chunk
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def merge_receipt_chunks(chunks: List[ReceiptChunk]) -> Tuple[Receipt, List[str]]:
+    """Merge per-chunk extractions into one validated Receipt plus warnings"""
+    fields = {}
+    for name in HEADER_FIELDS:
+        fields[name] = next(
+            (getattr(c, name) for c in chunks if getattr(c, name) is not None), None
+        )
+
+    line_items = [item for chunk in chunks for item in chunk.line_items]
+    subtotal = sum((item.total_price for item in line_items), Decimal("0"))
+
+    # Prefer the tax printed on the document, else derive it from the rate
+    warnings = []
+    tax_rate = fields["tax_rate"]
+    printed_tax = [c.tax_amount for c in chunks if c.tax_amount is not None]
+    if tax_rate is not None and 0 < tax_rate <= 1:
+        # tax_rate is a percentage and sales taxes are well above 1%, so 0.25
+        # is a fraction the model forgot to scale: read it as 25%
+        warnings.append(f"Tax rate {tax_rate} read as a fraction: {tax_rate * 100:g}%")
+        tax_rate = fields["tax_rate"] = tax_rate * 100
+    if printed_tax:
+        tax_amount = printed_tax[-1]
+    elif tax_rate is not None:
+        tax_amount = (subtotal * Decimal(str(tax_rate)) / 100).quantize(Decimal("0.01"))
+    else:
+        tax_amount = Decimal("0")
+    total_amount = subtotal + tax_amount
+
+    printed_totals = [c.total_amount for c in chunks if c.total_amount is not None]
+    if printed_totals and abs(printed_totals[-1] - total_amount) > Decimal("0.01"):
+        warnings.append(
+            f"Printed total {printed_totals[-1]} doesn't match recomputed "
+            f"total {total_amount}"
+        )
+
+    receipt = Receipt.model_validate(
+        {
+            **{k: v for k, v in fields.items() if v is not None},
+            "card_last_four": fields["card_last_four"],
+            "line_items": line_items,
+            "subtotal": subtotal,
+            "tax_amount": tax_amount,
+            "total_amount": total_amount,
+            "expense_categories": _merge_categories(chunks),
+            "extraction_confidence": min(c.extraction_confidence for c in chunks),
+        }
+    )
+    return receipt, warnings
+
+
+def _merge_categories(chunks: List[ReceiptChunk]) -> List[ExpenseCategory]:
+    merged: Dict[str, ExpenseCategory] = {}
+    for chunk in chunks:
+        for category in chunk.expense_categories:
+            existing = merged.get(category.category)
+            if existing is None:
+                merged[category.category] = category.model_copy(deep=True)
+                continue
+            existing.total_amount += category.total_amount
+            existing.item_count += category.item_count
+            existing.items.extend(category.items)
+    return list(merged.values())
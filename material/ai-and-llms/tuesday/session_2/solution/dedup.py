@@ -0,0 +1,337 @@
+"""
+Near-duplicate detection for receipt texts (MinHash + LSH)
+
+The same receipt is often uploaded several times with small differences
+(OCR noise, cropping, whitespace). Texts are normalised, split into
+character shingles and summarised as a MinHash signature, whose matching
+positions estimate the Jaccard similarity of two shingle sets. Signatures
+are cut into LSH bands stored in an indexed SQLite table, so a lookup is one
+indexed query for candidates plus a signature comparison.
+
+With the defaults (128 hashes in 16 bands of 8) documents above ~0.7
+similarity become candidates, and only those whose estimated similarity
+reaches `threshold` are reported as duplicates.
+
+Shingle similarity alone can't tell a re-upload from a repeat visit to the
+same shop: a receipt that differs only in its date, a quantity or its total
+is still ~0.95 similar. So every document also has key tokens (all numbers,
+plus month names) that must match exactly. A hash of the key tokens is mixed
+into every band hash, so the band lookup only returns documents with the
+same amounts and dates, however many other receipts from the same shop are
+stored. That keeps lookups well under a millisecond at millions of receipts.
+
+Usage:
+    index = DedupIndex("dedup_index.sqlite3")
+    index.add(text, result)
+    duplicate = index.find(other_text)  # (ExtractionResult, similarity) or None
+
+    python dedup.py --benchmark 1000000
+"""
+
+import argparse
+import hashlib
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from models import ExtractionResult
+
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBER = re.compile(r"\d+(?:[.,:/-]\d+)*")
+_LETTERS = re.compile(r"[^\W\d_]+")
+_SEED = 1_234_567
+
+# English and Swedish month names and abbreviations
+MONTHS = frozenset(
+    "january february march april may june july august september october "
+    "november december jan feb mar apr jun jul aug sep sept oct nov dec "
+    "januari februari mars maj juni juli augusti oktober okt".split()
+)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace runs to single spaces"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def key_tokens(text: str) -> str:
+    """Amounts, quantities, dates and times; these must match for a duplicate"""
+    lowered = text.lower()
+    tokens = [number.replace(",", ".") for number in _NUMBER.findall(lowered)]
+    tokens += [word for word in _LETTERS.findall(lowered) if word in MONTHS]
+    return " ".join(sorted(tokens))
+
+
+class MinHasher:
+    """MinHash signatures over character shingles, using multiply-shift hashing"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5):
+        rng = np.random.default_rng(_SEED)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # Odd multipliers make a*x + b (mod 2**64) a universal hash family
+        self._a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._powers = 31 ** np.arange(shingle_size, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        data = np.frombuffer(normalize_text(text).encode(), dtype=np.uint8)
+        if len(data) < self.shingle_size:
+            data = np.pad(data, (0, self.shingle_size - len(data)))
+
+        windows = sliding_window_view(data.astype(np.uint64), self.shingle_size)
+        # Repeated shingles don't change the minimum, so no need to dedupe them
+        hashes = np.multiply.outer(self._a, windows @ self._powers)
+        hashes += self._b[:, None]
+        # The top 32 bits of the smallest hash are the smallest top 32 bits
+        return (hashes.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+
+class DedupIndex:
+    """Persistent LSH index mapping receipt texts to their extraction results"""
+
+    def __init__(
+        self,
+        path: str = "dedup_index.sqlite3",
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 16,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm)
+
+        rng = np.random.default_rng(_SEED + 1)
+        self._band_mix = rng.integers(
+            1, 2**63, (bands, num_perm // bands), dtype=np.uint64
+        )
+        self._band_offsets = rng.integers(0, 2**63, bands, dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                key_tokens TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS bands (
+                band_hash INTEGER NOT NULL,
+                document_id INTEGER NOT NULL,
+                PRIMARY KEY (band_hash, document_id)
+            ) WITHOUT ROWID""")
+        self._conn.commit()
+
+    def find(
+        self, text: str, signature: Optional[np.ndarray] = None
+    ) -> Optional[Tuple[ExtractionResult, float]]:
+        """Most similar stored result at or above the threshold, with its similarity"""
+        if signature is None:
+            signature = self.hasher.signature(text)
+
+        with self._lock:
+            rows = self._candidates(key_tokens(text), signature)
+            if not rows:
+                return None
+
+            ids = [row[0] for row in rows]
+            candidates = np.frombuffer(
+                b"".join(row[1] for row in rows), dtype=np.uint32
+            ).reshape(len(rows), -1)
+            similarity = (candidates == signature).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] < self.threshold:
+                return None
+
+            (result_json,) = self._conn.execute(
+                "SELECT result_json FROM documents WHERE id = ?", (ids[best],)
+            ).fetchone()
+
+        return ExtractionResult.model_validate_json(result_json), float(
+            similarity[best]
+        )
+
+    def add(
+        self,
+        text: str,
+        result: ExtractionResult,
+        signature: Optional[np.ndarray] = None,
+    ):
+        if signature is None:
+            signature = self.hasher.signature(text)
+        with self._lock:
+            self._insert(text, result, signature)
+            self._conn.commit()
+
+    def add_many(self, documents: Iterable[Tuple[str, ExtractionResult]]):
+        """Add (text, result) pairs in one transaction, e.g. for a backfill"""
+        documents = [(t, r, self.hasher.signature(t)) for t, r in documents]
+        with self._lock:
+            for text, result, signature in documents:
+                self._insert(text, result, signature)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def _insert(self, text: str, result: ExtractionResult, signature: np.ndarray):
+        tokens = key_tokens(text)
+        cursor = self._conn.execute(
+            "INSERT INTO documents (signature, key_tokens, result_json, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                signature.tobytes(),
+                tokens,
+                result.model_dump_json(exclude={"metrics"}),
+                time.time(),
+            ),
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO bands (band_hash, document_id) VALUES (?, ?)",
+            [(h, cursor.lastrowid) for h in self._band_hashes(signature, tokens)],
+        )
+
+    def _candidates(self, tokens: str, signature: np.ndarray) -> List[tuple]:
+        """(id, signature) of documents sharing a band and the key tokens"""
+        band_hashes = self._band_hashes(signature, tokens)
+        # key_tokens is checked again, since different tokens can share a hash
+        return self._conn.execute(
+            "SELECT id, signature FROM documents WHERE key_tokens = ? AND id IN ("
+            "SELECT document_id FROM bands WHERE band_hash IN "
+            f"({','.join('?' * len(band_hashes))}))",
+            [tokens, *band_hashes],
+        ).fetchall()
+
+    def _band_hashes(self, signature: np.ndarray, tokens: str) -> list:
+        rows = signature.astype(np.uint64).reshape(self.bands, -1)
+        token_hash = np.frombuffer(
+            hashlib.blake2b(tokens.encode(), digest_size=8).digest(), dtype=np.uint64
+        )
+        mixed = (rows * self._band_mix).sum(axis=1) + self._band_offsets + token_hash
+        # SQLite integers are signed 64-bit
+        return mixed.view(np.int64).tolist()
+
+
+def synthetic_receipt(rng: random.Random, store: int) -> str:
+    """A receipt from one of a few stores; same layout, different numbers"""
+    lines = [
+        f"STORE {store} SUPERMARKET",
+        f"Storgatan {store}, Stockholm",
+        f"Receipt #{rng.randint(1, 10**8)}",
+        f"March {rng.randint(1, 28)}, 2024 - {rng.randint(8, 21)}:{rng.randint(0, 59):02d}",
+    ]
+    subtotal = 0
+    for item in rng.sample(["Milk", "Bread", "Coffee", "Apples", "Cheese"], 4):
+        quantity, price = rng.randint(1, 4), rng.randint(10, 120)
+        subtotal += quantity * price
+        lines.append(f"{quantity}x {item}  {quantity * price} SEK")
+    lines += [f"Subtotal: {subtotal} SEK", f"Total: {subtotal * 1.25:.2f} SEK"]
+    return "\n".join(lines)
+
+
+def ocr_noise(text: str, rng: random.Random) -> str:
+    """A re-upload: extra whitespace and one letter of the header dropped or doubled"""
+    header, rest = text.split("\n", 2)[:2], text.split("\n", 2)[2]
+    chars = list("\n".join(header))
+    i = rng.choice([i for i, char in enumerate(chars) if char.isalpha()])
+    chars[i] = chars[i] * rng.choice([0, 2])
+    return "".join(chars) + "\n\n" + rest.replace("  ", "   ")
+
+
+def benchmark(
+    n_documents: int = 1_000_000,
+    stores: int = 20,
+    n_queries: int = 1_000,
+    seed: int = 0,
+):
+    """find() latency with many similar receipts per store already indexed"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = DedupIndex(str(Path(directory) / "dedup_benchmark.sqlite3"))
+        try:
+            _benchmark_index(index, n_documents, stores, n_queries, random.Random(seed))
+        finally:
+            index.close()
+
+
+def _benchmark_index(
+    index: DedupIndex, n_documents: int, stores: int, n_queries: int, rng
+):
+    result = ExtractionResult(success=True)
+
+    start = time.perf_counter()
+    stored = []
+    for offset in range(0, n_documents, 50_000):
+        batch = [
+            synthetic_receipt(rng, i % stores)
+            for i in range(offset, min(offset + 50_000, n_documents))
+        ]
+        index.add_many((text, result) for text in batch)
+        stored.extend(rng.sample(batch, min(len(batch), n_queries)))
+    print(
+        f"Indexed {n_documents:,} receipts from {stores} stores "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+    queries = {
+        "re-upload (hit)": [
+            ocr_noise(text, rng) for text in rng.sample(stored, n_queries)
+        ],
+        "new visit (miss)": [
+            synthetic_receipt(rng, i % stores) for i in range(n_queries)
+        ],
+    }
+    for name, texts in queries.items():
+        signatures = [index.hasher.signature(text) for text in texts]
+        candidates = [
+            len(index._candidates(key_tokens(t), s)) for t, s in zip(texts, signatures)
+        ]
+        timings = []
+        found = 0
+        for text, signature in zip(texts, signatures):
+            start = time.perf_counter()
+            found += index.find(text, signature) is not None
+            timings.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(timings, [50, 99]) * 1000
+        print(
+            f"{name:<17} p50 {p50:.3f}ms  p99 {p99:.3f}ms  "
+            f"candidates/query {np.mean(candidates):.2f}  matched {found}/{len(texts)}"
+        )
+
+    start = time.perf_counter()
+    for text in queries["new visit (miss)"]:
+        index.hasher.signature(text)
+    elapsed = (time.perf_counter() - start) / n_queries * 1000
+    print(f"signature         {elapsed:.3f}ms per receipt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the receipt dedup index")
+    parser.add_argument("--benchmark", type=int, default=1_000_000, metavar="N")
+    parser.add_argument("--stores", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(args.benchmark, args.stores)
+
+
+if __name__ == "__main__":
+    main()
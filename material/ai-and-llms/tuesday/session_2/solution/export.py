@@ -0,0 +1,264 @@
+"""
+Columnar export of extracted receipts for analytics
+
+Receipts are flattened into three normalised tables - receipts, line_items
+and expense_categories - joined on receipt_id. Rows are buffered per table
+and written out every batch_size rows as NumPy column arrays, so memory use
+is bounded by the batch size rather than by the number of receipts.
+
+Parquet is written when pyarrow is installed (one row group per batch),
+otherwise each table is appended to a CSV file. Money columns are stored as
+int64 minor units (cents) to keep them exact and cheap to aggregate.
+
+Usage:
+    python export.py results_dir/ export_dir/ [--format csv]
+"""
+
+import argparse
+import csv
+import json
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from models import ExtractionResult, Receipt
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Column name and kind (str, int64, float64 or date) per table
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "receipts": [
+        ("receipt_id", "str"),
+        ("receipt_number", "str"),
+        ("transaction_date", "date"),
+        ("transaction_time", "str"),
+        ("merchant_name", "str"),
+        ("merchant_location", "str"),
+        ("currency", "str"),
+        ("subtotal_cents", "int64"),
+        ("tax_rate", "float64"),
+        ("tax_amount_cents", "int64"),
+        ("total_amount_cents", "int64"),
+        ("payment_method", "str"),
+        ("card_last_four", "str"),
+        ("extraction_confidence", "float64"),
+    ],
+    "line_items": [
+        ("receipt_id", "str"),
+        ("line_number", "int64"),
+        ("description", "str"),
+        ("quantity", "int64"),
+        ("unit_price_cents", "int64"),
+        ("total_price_cents", "int64"),
+    ],
+    "expense_categories": [
+        ("receipt_id", "str"),
+        ("category", "str"),
+        ("total_amount_cents", "int64"),
+        ("item_count", "int64"),
+    ],
+}
+
+
+def to_cents(amount: Decimal) -> int:
+    return int((amount * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def to_arrays(table: str, columns: Dict[str, list]) -> Dict[str, np.ndarray]:
+    """Convert buffered column values into typed NumPy arrays"""
+    arrays = {}
+    for name, kind in TABLES[table]:
+        values = columns[name]
+        if kind == "int64":
+            arrays[name] = np.array(values, dtype=np.int64)
+        elif kind == "float64":
+            arrays[name] = np.array(
+                [np.nan if v is None else v for v in values], dtype=np.float64
+            )
+        elif kind == "date":
+            arrays[name] = np.array(values, dtype="datetime64[D]")
+        else:
+            arrays[name] = np.array(values, dtype=object)
+    return arrays
+
+
+class ColumnarExporter:
+    """Incremental writer for the receipts, line_items and expense_categories tables"""
+
+    def __init__(
+        self,
+        out_dir: str,
+        batch_size: int = 50_000,
+        format: Optional[str] = None,
+    ):
+        self.format = format or ("parquet" if pq else "csv")
+        if self.format not in ("parquet", "csv"):
+            raise ValueError(f"Unsupported export format: {self.format}")
+        if self.format == "parquet" and pq is None:
+            raise ImportError("Parquet export requires pyarrow")
+
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.rows_written = {table: 0 for table in TABLES}
+        self._buffers = {table: self._empty_buffer(table) for table in TABLES}
+        self._writers: Dict[str, object] = {}
+        self._files: Dict[str, object] = {}
+
+    def add(self, receipt_id: str, receipt: Receipt):
+        """Buffer one receipt, flushing any table that reached batch_size"""
+        self._append(
+            "receipts",
+            receipt_id=receipt_id,
+            receipt_number=receipt.receipt_number,
+            transaction_date=receipt.transaction_date,
+            transaction_time=receipt.transaction_time,
+            merchant_name=receipt.merchant_name,
+            merchant_location=receipt.merchant_location,
+            currency=receipt.currency,
+            subtotal_cents=to_cents(receipt.subtotal),
+            tax_rate=receipt.tax_rate,
+            tax_amount_cents=to_cents(receipt.tax_amount),
+            total_amount_cents=to_cents(receipt.total_amount),
+            payment_method=receipt.payment_method,
+            card_last_four=receipt.card_last_four,
+            extraction_confidence=receipt.extraction_confidence,
+        )
+        for line_number, item in enumerate(receipt.line_items, start=1):
+            self._append(
+                "line_items",
+                receipt_id=receipt_id,
+                line_number=line_number,
+                description=item.description,
+                quantity=item.quantity,
+                unit_price_cents=to_cents(item.unit_price),
+                total_price_cents=to_cents(item.total_price),
+            )
+        for category in receipt.expense_categories:
+            self._append(
+                "expense_categories",
+                receipt_id=receipt_id,
+                category=category.category,
+                total_amount_cents=to_cents(category.total_amount),
+                item_count=category.item_count,
+            )
+
+        for table, buffer in self._buffers.items():
+            if len(buffer["receipt_id"]) >= self.batch_size:
+                self._flush_table(table)
+
+    def add_results(self, results: Iterable[Tuple[str, ExtractionResult]]) -> int:
+        """Export the successful results from (receipt_id, result) pairs"""
+        count = 0
+        for receipt_id, result in results:
+            if result.was_successful():
+                self.add(receipt_id, result.document)
+                count += 1
+        return count
+
+    def flush(self):
+        for table in TABLES:
+            self._flush_table(table)
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        for f in self._files.values():
+            f.close()
+        self._writers.clear()
+        self._files.clear()
+
+    def __enter__(self) -> "ColumnarExporter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _empty_buffer(self, table: str) -> Dict[str, list]:
+        return {name: [] for name, _ in TABLES[table]}
+
+    def _append(self, table: str, **row):
+        buffer = self._buffers[table]
+        for name, value in row.items():
+            buffer[name].append(value)
+
+    def _flush_table(self, table: str):
+        buffer = self._buffers[table]
+        count = len(buffer["receipt_id"])
+        if count == 0:
+            return
+
+        arrays = to_arrays(table, buffer)
+        if self.format == "parquet":
+            self._write_parquet(table, arrays)
+        else:
+            self._write_csv(table, arrays)
+        self.rows_written[table] += count
+        self._buffers[table] = self._empty_buffer(table)
+
+    def _write_parquet(self, table: str, arrays: Dict[str, np.ndarray]):
+        types = {
+            "str": pa.string(),
+            "int64": pa.int64(),
+            "float64": pa.float64(),
+            "date": pa.date32(),
+        }
+        batch = pa.table(
+            {
+                # from_pandas turns NaN into null for the optional float columns
+                name: pa.array(arrays[name], type=types[kind], from_pandas=True)
+                for name, kind in TABLES[table]
+            }
+        )
+        if table not in self._writers:
+            path = self.out_dir / f"{table}.parquet"
+            self._writers[table] = pq.ParquetWriter(path, batch.schema)
+        self._writers[table].write_table(batch)
+
+    def _write_csv(self, table: str, arrays: Dict[str, np.ndarray]):
+        if table not in self._files:
+            f = open(self.out_dir / f"{table}.csv", "w", newline="")
+            csv.writer(f).writerow([name for name, _ in TABLES[table]])
+            self._files[table] = f
+
+        columns = []
+        for name, kind in TABLES[table]:
+            values = arrays[name]
+            if kind == "float64":
+                columns.append(np.where(np.isnan(values), "", values.astype(str)))
+            elif kind == "str":
+                columns.append(["" if v is None else v for v in values])
+            else:
+                columns.append(values.astype(str))
+        csv.writer(self._files[table]).writerows(zip(*columns))
+
+
+def iter_result_files(results_dir: str) -> Iterable[Tuple[str, ExtractionResult]]:
+    """Read ExtractionResult JSON files (e.g. from ingest.py) one at a time"""
+    for path in sorted(Path(results_dir).rglob("*.result.json")):
+        with open(path) as f:
+            result = ExtractionResult.model_validate(json.load(f))
+        yield path.name[: -len(".result.json")], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export receipts to columnar tables")
+    parser.add_argument("results_dir", help="Directory with *.result.json files")
+    parser.add_argument("out_dir", help="Directory to write the tables to")
+    parser.add_argument("--format", choices=["parquet", "csv"])
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with ColumnarExporter(args.out_dir, args.batch_size, args.format) as exporter:
+        count = exporter.add_results(iter_result_files(args.results_dir))
+
+    print(f"Exported {count} receipts as {exporter.format}: {exporter.rows_written}")
+
+
+if __name__ == "__main__":
+    main()
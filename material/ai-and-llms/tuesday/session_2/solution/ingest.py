@@ -0,0 +1,335 @@
+"""
+Long-running ingestion service for receipt files
+
+Watches a directory for receipt text files, tracks each one in a SQLite job
+table and feeds them to a pool of async extraction workers. Every result is
+written as JSON next to its input (receipt.txt -> receipt.result.json). A job
+is only marked done once its result file is in place, so a restart re-queues
+unfinished work without reprocessing anything that already completed.
+
+Usage:
+    python ingest.py incoming/ --concurrency 16
+    python ingest.py incoming/ --once   # drain the current backlog and exit
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from dedup import DedupIndex
+from extractor import DocumentExtractor
+from models import ExtractionResult
+
+sys.path.append(str(Path(__file__).resolve().parents[3] / "shared"))
+from llm_scheduler import Priority
+
+RESULT_SUFFIX = ".result.json"
+
+
+class JobStore:
+    """SQLite job table with one row per input file"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at)"
+        )
+        # Jobs claimed by a run that stopped before finishing them
+        self._conn.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'running'"
+        )
+        self._conn.commit()
+
+    def known_files(self) -> Dict[str, float]:
+        return dict(self._conn.execute("SELECT path, mtime FROM jobs"))
+
+    def add(self, path: str, mtime: float):
+        """Queue a new file, or re-queue one that changed since it was processed"""
+        self._conn.execute(
+            "INSERT INTO jobs (path, mtime, status, updated_at) "
+            "VALUES (?, ?, 'pending', ?) "
+            "ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime, "
+            "status = 'pending', attempts = 0, error = NULL, "
+            "updated_at = excluded.updated_at WHERE mtime != excluded.mtime",
+            (path, mtime, time.time()),
+        )
+        self._conn.commit()
+
+    def claim(self, limit: int) -> List[str]:
+        rows = self._conn.execute(
+            "SELECT path FROM jobs WHERE status = 'pending' "
+            "ORDER BY updated_at LIMIT ?",
+            (limit,),
+        ).fetchall()
+        paths = [path for (path,) in rows]
+        self._conn.executemany(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1 "
+            "WHERE path = ?",
+            [(path,) for path in paths],
+        )
+        self._conn.commit()
+        return paths
+
+    def finish(self, path: str, status: str, error: Optional[str] = None):
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE path = ?",
+            (status, error, time.time(), path),
+        )
+        self._conn.commit()
+
+    def attempts(self, path: str) -> int:
+        row = self._conn.execute(
+            "SELECT attempts FROM jobs WHERE path = ?", (path,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def counts(self) -> Dict[str, int]:
+        return dict(
+            self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
+
+    def close(self):
+        self._conn.close()
+
+
+class IngestionService:
+    """Directory watcher feeding a pool of async extraction workers"""
+
+    def __init__(
+        self,
+        extractor: DocumentExtractor,
+        watch_dir: str,
+        concurrency: int = 8,
+        pattern: str = "*.txt",
+        poll_interval: float = 2.0,
+        settle_seconds: float = 1.0,
+        max_attempts: int = 3,
+        report_interval: float = 30.0,
+        state_path: Optional[str] = None,
+    ):
+        self.extractor = extractor
+        self.watch_dir = Path(watch_dir)
+        self.concurrency = concurrency
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        # Files modified more recently than this may still be being written
+        self.settle_seconds = settle_seconds
+        self.max_attempts = max_attempts
+        self.report_interval = report_interval
+        self.jobs = JobStore(state_path or str(self.watch_dir / ".ingest.sqlite3"))
+
+        self._known = self.jobs.known_files()
+        self._completed: Deque[float] = deque()
+        self._in_flight = 0
+        self._queued = 0
+        self._started = time.monotonic()
+
+    async def run(self, once: bool = False, stop: Optional[asyncio.Event] = None):
+        """Process files until stopped, or until the backlog is empty with once"""
+        stop = stop or asyncio.Event()
+        # Set whenever a worker takes or finishes a job, so the queue is
+        # refilled right away instead of on the next directory scan
+        self._wake = asyncio.Event()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)
+        ]
+        stopper = asyncio.create_task(self._wake_on(stop))
+        last_report = time.monotonic()
+        next_scan = 0.0
+
+        try:
+            while not stop.is_set():
+                if time.monotonic() >= next_scan:
+                    self.scan()
+                    next_scan = time.monotonic() + self.poll_interval
+                # Cleared before claiming, so a wake-up during the claim isn't lost
+                self._wake.clear()
+                for path in self.jobs.claim(queue.maxsize - queue.qsize()):
+                    self._queued += 1
+                    queue.put_nowait(path)
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    self.report()
+                    last_report = time.monotonic()
+
+                if once and self._queued == 0 and self._in_flight == 0:
+                    if not self.jobs.counts().get("pending"):
+                        break
+
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(), max(next_scan - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in [*workers, stopper]:
+                task.cancel()
+            await asyncio.gather(*workers, stopper, return_exceptions=True)
+            self.report()
+            self.jobs.close()
+
+    def scan(self):
+        """Register new and modified input files as pending jobs"""
+        now = time.time()
+        for path in sorted(self.watch_dir.glob(self.pattern)):
+            if path.name.endswith(RESULT_SUFFIX) or not path.is_file():
+                continue
+            mtime = path.stat().st_mtime
+            key = str(path)
+            if self._known.get(key) == mtime or now - mtime < self.settle_seconds:
+                continue
+            self.jobs.add(key, mtime)
+            self._known[key] = mtime
+
+    def stats(self) -> Dict[str, float]:
+        counts = self.jobs.counts()
+        # Completions over the last minute, or since start if that's shorter
+        now = time.monotonic()
+        while self._completed and now - self._completed[0] > 60:
+            self._completed.popleft()
+        window = min(60.0, max(now - self._started, 1e-9))
+        return {
+            "backlog": counts.get("pending", 0) + self._queued,
+            "in_flight": self._in_flight,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "per_minute": len(self._completed) * 60.0 / window,
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"backlog={stats['backlog']} in_flight={stats['in_flight']} "
+            f"done={stats['done']} failed={stats['failed']} "
+            f"throughput={stats['per_minute']:.1f}/min"
+        )
+
+    async def _wake_on(self, stop: asyncio.Event):
+        await stop.wait()
+        self._wake.set()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            path = await queue.get()
+            self._queued -= 1
+            self._in_flight += 1
+            self._wake.set()
+            try:
+                await self._process(path)
+            except Exception as e:
+                # Even recording the failure failed; keep the worker alive and
+                # leave the job to be re-queued on restart
+                print(f"Error processing {path}: {e}")
+            finally:
+                self._in_flight -= 1
+                queue.task_done()
+                self._wake.set()
+
+    async def _process(self, path: str):
+        try:
+            text = Path(path).read_text().strip()
+            result = await self.extractor.extract_document_async(
+                text, "receipt", priority=Priority.BATCH
+            )
+            write_result(Path(path), result)
+        except OSError as e:
+            # Unreadable or vanished input; a later change re-queues it
+            self.jobs.finish(path, "failed", str(e))
+            return
+        except Exception as e:
+            # A bug in extraction, the dedup index or a metrics hook; retried
+            # like a failed extraction so the job never stays "running"
+            self._completed.append(time.monotonic())
+            self._retry_or_fail(path, f"{type(e).__name__}: {e}")
+            return
+
+        self._completed.append(time.monotonic())
+        if result.success:
+            self.jobs.finish(path, "done")
+        else:
+            self._retry_or_fail(path, result.error_message)
+
+    def _retry_or_fail(self, path: str, error: Optional[str]):
+        if self.jobs.attempts(path) < self.max_attempts:
+            self.jobs.finish(path, "pending", error)
+        else:
+            self.jobs.finish(path, "failed", error)
+
+
+def result_path(input_path: Path) -> Path:
+    return input_path.with_name(input_path.stem + RESULT_SUFFIX)
+
+
+def write_result(input_path: Path, result: ExtractionResult):
+    path = result_path(input_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(result.model_dump_json(indent=2))
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receipt ingestion service")
+    parser.add_argument("watch_dir", help="Directory to watch for receipt files")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pattern", default="*.txt")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--report-interval", type=float, default=30.0)
+    parser.add_argument(
+        "--once", action="store_true", help="Exit once the backlog is drained"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Always extract, even for re-uploads of a receipt seen before",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("OPENAI_API_KEY"):
+        print("Error: Set OPENAI_API_KEY environment variable")
+        return
+
+    service = IngestionService(
+        DocumentExtractor(
+            max_concurrency=args.concurrency,
+            # Re-uploads of the same receipt (same amounts and dates, text
+            # differing only by OCR noise) are answered without a model call
+            dedup_index=(
+                None
+                if args.no_dedup
+                else DedupIndex(str(Path(args.watch_dir) / ".dedup.sqlite3"))
+            ),
+        ),
+        args.watch_dir,
+        concurrency=args.concurrency,
+        pattern=args.pattern,
+        poll_interval=args.poll_interval,
+        report_interval=args.report_interval,
+    )
+    try:
+        asyncio.run(service.run(once=args.once))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
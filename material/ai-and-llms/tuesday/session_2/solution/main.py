@@ -2,6 +2,7 @@
 
 import os
 import json
+from pathlib import Path
 from typing import Dict
 from dotenv import load_dotenv
 from extractor import DocumentExtractor
@@ -29,6 +30,24 @@ class ReceiptProcessingDemo:
             result = self.extractor.extract_document(doc_text, doc_type)
             self._display_result(doc_name, result)
 
+    def run_batch(self, input_dir: str, work_dir: str = "batch_job"):
+        """Process every .txt receipt in input_dir through the Batch API"""
+        print(f"Batch mode - receipts from {input_dir}")
+        print("=" * 40)
+
+        paths = sorted(Path(input_dir).glob("*.txt"))
+        documents = ((path.name, path.read_text().strip()) for path in paths)
+
+        succeeded = failed = 0
+        for custom_id, result in self.extractor.extract_batch(documents, work_dir):
+            self._display_result(custom_id, result)
+            if result.was_successful():
+                succeeded += 1
+            else:
+                failed += 1
+
+        print(f"\nBatch finished: {succeeded} succeeded, {failed} failed")
+
     def _get_sample_documents(self) -> Dict[str, tuple[str, str]]:
         try:
             with open("material/week_1/tuesday/session_2/sample_receipt.txt", "r") as f:
@@ -43,6 +62,8 @@ class ReceiptProcessingDemo:
     def _display_result(self, doc_name: str, result: ExtractionResult):
         if result.was_successful():
             print(f"{doc_name}: SUCCESS - Confidence: {result.confidence_score:.2f}")
+            if result.model:
+                print(f"Model: {result.model} (tier {result.model_tier})")
             doc = result.document
             if hasattr(doc, "total_amount"):
                 print(f"Total: {doc.currency} {doc.total_amount}")
@@ -98,9 +119,10 @@ def main():
         print("\nReceipt Expense Categorization Demo")
         print("1. Sample receipt")
         print("2. Interactive mode (enter your own receipt)")
-        print("3. Exit")
+        print("3. Batch mode (directory of receipts, resumable)")
+        print("4. Exit")
 
-        choice = input("\nChoose (1-3): ").strip()
+        choice = input("\nChoose (1-4): ").strip()
 
         try:
             if choice == "1":
@@ -108,6 +130,9 @@ def main():
             elif choice == "2":
                 demo.interactive_mode()
             elif choice == "3":
+                input_dir = input("Receipt directory: ").strip()
+                demo.run_batch(input_dir)
+            elif choice == "4":
                 break
         except KeyboardInterrupt:
             break
@@ -0,0 +1,200 @@
+"""
+Per-stage latency and token instrumentation for the extraction pipeline
+
+The extractor activates an ExtractionMetrics object for the duration of each
+extraction (track_metrics). Code anywhere in the pipeline records into it
+with record_stage / record_usage / record_retry, and the httpx event hooks
+below capture time-to-first-byte without touching the OpenAI SDK. Finished
+results can be aggregated in a MetricsRegistry and exported in Prometheus
+text format.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from models import ExtractionMetrics, ExtractionResult
+
+_current_metrics: ContextVar[Optional[ExtractionMetrics]] = ContextVar(
+    "current_metrics", default=None
+)
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+@contextmanager
+def track_metrics() -> Iterator[ExtractionMetrics]:
+    metrics = ExtractionMetrics()
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        try:
+            _current_metrics.reset(token)
+        except ValueError:
+            # Generator closed from a different context (e.g. garbage collected)
+            _current_metrics.set(None)
+
+
+@contextmanager
+def record_stage(name: str) -> Iterator[None]:
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            elapsed = time.perf_counter() - start
+            metrics.stage_seconds[name] = metrics.stage_seconds.get(name, 0.0) + elapsed
+
+
+def record_usage(usage):
+    metrics = _current_metrics.get()
+    if metrics is None or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    metrics.prompt_tokens = (metrics.prompt_tokens or 0) + prompt
+    metrics.completion_tokens = (metrics.completion_tokens or 0) + completion
+    metrics.cached_tokens = (metrics.cached_tokens or 0) + cached
+
+
+def record_retry(attempt: int, delay: float):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.retries += 1
+
+
+def record_queue_wait(seconds: float):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.stage_seconds["queue_wait"] = (
+            metrics.stage_seconds.get("queue_wait", 0.0) + seconds
+        )
+
+
+# httpx event hooks: "response" fires once headers arrive, before the body is read
+
+
+def _on_request(request):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics._request_started = time.perf_counter()
+
+
+def _on_response(response):
+    metrics = _current_metrics.get()
+    if metrics is not None and metrics._request_started is not None:
+        # Keep the first byte of the first response (chunked extractions send several)
+        metrics.stage_seconds.setdefault(
+            "time_to_first_byte", time.perf_counter() - metrics._request_started
+        )
+
+
+async def _on_request_async(request):
+    _on_request(request)
+
+
+async def _on_response_async(response):
+    _on_response(response)
+
+
+HTTP_EVENT_HOOKS = {"request": [_on_request], "response": [_on_response]}
+ASYNC_HTTP_EVENT_HOOKS = {
+    "request": [_on_request_async],
+    "response": [_on_response_async],
+}
+
+
+class MetricsRegistry:
+    """Aggregates ExtractionResult metrics and renders Prometheus text format"""
+
+    def __init__(self, prefix: str = "receipt_extraction"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._results: Dict[Tuple[str, str], int] = {}
+        self._tokens = {"prompt": 0, "completion": 0, "cached": 0}
+        self._models: Dict[str, int] = {}
+        self._cache_hits = 0
+        self._retries = 0
+        # stage -> (bucket counts, sum, count)
+        self._stages: Dict[str, Tuple[List[int], float, int]] = {}
+
+    def observe(self, result: ExtractionResult):
+        """Hook for DocumentExtractor(metrics_hooks=[registry.observe])"""
+        metrics = result.metrics
+        if metrics is None:
+            return
+
+        with self._lock:
+            key = (metrics.extraction_method, "success" if result.success else "error")
+            self._results[key] = self._results.get(key, 0) + 1
+            self._tokens["prompt"] += metrics.prompt_tokens or 0
+            self._tokens["completion"] += metrics.completion_tokens or 0
+            self._tokens["cached"] += metrics.cached_tokens or 0
+            if result.model:
+                self._models[result.model] = self._models.get(result.model, 0) + 1
+            self._cache_hits += int(metrics.cache_hit)
+            self._retries += metrics.retries
+
+            for stage, seconds in metrics.stage_seconds.items():
+                buckets, total, count = self._stages.get(
+                    stage, ([0] * len(STAGE_BUCKETS), 0.0, 0)
+                )
+                for i, bound in enumerate(STAGE_BUCKETS):
+                    if seconds <= bound:
+                        buckets[i] += 1
+                self._stages[stage] = (buckets, total + seconds, count + 1)
+
+    def render_prometheus(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_total Extractions by method and outcome",
+            f"# TYPE {p}_total counter",
+        ]
+        with self._lock:
+            for (method, status), count in sorted(self._results.items()):
+                lines.append(
+                    f'{p}_total{{method="{method}",status="{status}"}} {count}'
+                )
+
+            lines += [
+                f"# HELP {p}_tokens_total Tokens used by kind",
+                f"# TYPE {p}_tokens_total counter",
+            ]
+            for kind, count in self._tokens.items():
+                lines.append(f'{p}_tokens_total{{kind="{kind}"}} {count}')
+
+            lines += [
+                f"# HELP {p}_model_answers_total Extractions answered per model tier",
+                f"# TYPE {p}_model_answers_total counter",
+            ]
+            for model, count in sorted(self._models.items()):
+                lines.append(f'{p}_model_answers_total{{model="{model}"}} {count}')
+
+            lines += [
+                f"# HELP {p}_cache_hits_total Extractions answered from the cache",
+                f"# TYPE {p}_cache_hits_total counter",
+                f"{p}_cache_hits_total {self._cache_hits}",
+                f"# HELP {p}_retries_total Retried model requests",
+                f"# TYPE {p}_retries_total counter",
+                f"{p}_retries_total {self._retries}",
+                f"# HELP {p}_stage_seconds Time spent per pipeline stage",
+                f"# TYPE {p}_stage_seconds histogram",
+            ]
+            for stage, (buckets, total, count) in sorted(self._stages.items()):
+                for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                    lines.append(
+                        f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} '
+                        f"{bucket_count}"
+                    )
+                lines += [
+                    f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}',
+                    f'{p}_stage_seconds_sum{{stage="{stage}"}} {total}',
+                    f'{p}_stage_seconds_count{{stage="{stage}"}} {count}',
+                ]
+
+        return "\n".join(lines) + "\n"
@@ -5,11 +5,18 @@ Week 1 - Tuesday - Session 2 Lab
 Define your Pydantic models here for structured data extraction
 """
 
-from typing import List, Optional, Literal
-from pydantic import BaseModel, Field, field_validator
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Literal, Type, Union
+from pydantic import BaseModel, Field, PrivateAttr, TypeAdapter, field_validator
 from datetime import date
 from decimal import Decimal
 
+try:
+    # Private SDK helper behind client.chat.completions.parse (openai>=1.40)
+    from openai.lib._parsing._completions import type_to_response_format_param
+except ImportError:
+    type_to_response_format_param = None
+
 
 class ExpenseCategory(BaseModel):
     """Categorized expense information"""
@@ -53,7 +60,9 @@ class Receipt(BaseModel):
     # Items and payment
     line_items: List[LineItem]
     subtotal: Decimal = Field(ge=0)
-    tax_rate: Optional[float] = None
+    tax_rate: Optional[float] = Field(
+        default=None, description="Tax rate in percent, e.g. 25.0 for 25%"
+    )
     tax_amount: Decimal = Field(ge=0)
     total_amount: Decimal = Field(ge=0)
     currency: str = Field(default="USD")
@@ -82,6 +91,49 @@ class Receipt(BaseModel):
         return v
 
 
+class ReceiptChunk(BaseModel):
+    """Part of a long receipt, extracted on its own and merged afterwards"""
+
+    # Header fields are only filled in when they appear in this part
+    receipt_number: Optional[str] = None
+    transaction_date: Optional[date] = None
+    transaction_time: Optional[str] = None
+    merchant_name: Optional[str] = None
+    merchant_location: Optional[str] = None
+    currency: Optional[str] = None
+    payment_method: Optional[Literal["cash", "card", "digital", "other"]] = None
+    card_last_four: Optional[str] = Field(
+        default=None, pattern=r"^\d{4}$", description="Last 4 digits of card"
+    )
+
+    line_items: List[LineItem] = Field(default_factory=list)
+
+    # Amounts as printed in this part, if any; the merged totals are recomputed
+    tax_rate: Optional[float] = Field(
+        default=None, description="Tax rate in percent, e.g. 25.0 for 25%"
+    )
+    tax_amount: Optional[Decimal] = Field(default=None, ge=0)
+    total_amount: Optional[Decimal] = Field(default=None, ge=0)
+
+    expense_categories: List[ExpenseCategory] = Field(default_factory=list)
+    extraction_confidence: float = Field(ge=0.0, le=1.0, default=0.0)
+
+
+class ExtractionMetrics(BaseModel):
+    """Per-stage timings and counters for a single extraction"""
+
+    stage_seconds: Dict[str, float] = Field(default_factory=dict)
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Prompt tokens served from OpenAI's prompt cache
+    cached_tokens: Optional[int] = None
+    cache_hit: bool = False
+    retries: int = 0
+    extraction_method: str = "llm"
+
+    _request_started: Optional[float] = PrivateAttr(default=None)
+
+
 class ExtractionResult(BaseModel):
     """Wrapper for extraction results with metadata"""
 
@@ -90,6 +142,12 @@ class ExtractionResult(BaseModel):
     error_message: Optional[str] = None
     processing_time: Optional[float] = None
     tokens_used: Optional[int] = None
+    cache_hit: bool = False
+    extraction_method: Literal["llm", "rules", "duplicate"] = "llm"
+    # Which routing tier answered (0 = cheapest); None for local/cached answers
+    model: Optional[str] = None
+    model_tier: Optional[int] = None
+    metrics: Optional[ExtractionMetrics] = None
 
     # Quality indicators
     confidence_score: float = Field(ge=0.0, le=1.0, default=0.0)
@@ -100,5 +158,87 @@ class ExtractionResult(BaseModel):
         return self.success and self.document is not None
 
 
+class ExtractionEvent(BaseModel):
+    """Incremental output from a streaming extraction"""
+
+    event_type: Literal["field", "line_item", "result"]
+    field_name: Optional[str] = None
+    value: Any = None
+    line_item: Optional[LineItem] = None
+    result: Optional[ExtractionResult] = None
+
+
+class ExpenseTotal(BaseModel):
+    """Aggregated spend for one group within one currency"""
+
+    key: str
+    currency: str
+    total_cents: int
+    item_count: int
+
+    @property
+    def total_amount(self) -> Decimal:
+        return Decimal(self.total_cents) / 100
+
+
 # Helper type for document type
 DocumentType = Receipt
+
+
+# Hot-path helpers: schemas and validators are built once per model class
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(model_class: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(model_class)
+
+
+@lru_cache(maxsize=None)
+def get_response_format(model_class: Type[BaseModel]) -> dict:
+    """Strict JSON schema response_format for a model, generated once"""
+    if type_to_response_format_param is not None:
+        return type_to_response_format_param(model_class)
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_class.__name__,
+            "schema": strict_json_schema(model_class.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+def strict_json_schema(node: Any) -> Any:
+    """Pydantic JSON schema adjusted to what structured outputs' strict mode accepts"""
+    if isinstance(node, list):
+        return [strict_json_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    node = {
+        key: value if key == "properties" else strict_json_schema(value)
+        for key, value in node.items()
+        # A null default says nothing that the nullable type doesn't
+        if not (key == "default" and value is None)
+    }
+    if "properties" in node:
+        node["properties"] = {
+            name: strict_json_schema(value)
+            for name, value in node["properties"].items()
+        }
+        # Every field must be listed; optional ones are nullable instead
+        node["required"] = list(node["properties"])
+        node["additionalProperties"] = False
+    if "$ref" in node and len(node) > 1:
+        # No other keywords are allowed next to a $ref
+        node = {"$ref": node["$ref"]}
+    return node
+
+
+def validate_document_json(model_class: Type[BaseModel], data: Union[str, bytes]):
+    """Validate raw JSON straight into the model, skipping the dict round trip"""
+    return get_type_adapter(model_class).validate_json(data)
+
+
+def count_populated_fields(document: BaseModel) -> int:
+    # Field values live in __dict__, so there's no need for a full model_dump()
+    return sum(1 for v in document.__dict__.values() if v is not None)
@@ -0,0 +1,236 @@
+"""
+Rule-based receipt parser
+
+Deterministic fast path for receipts in the common "Nx Description  Price SEK"
+layout (see sample_receipt.txt). parse_receipt only returns a Receipt when
+every check passes: the layout is recognised, line items add up to the
+subtotal, the Receipt validators accept the totals and every item lands in
+an expense category. Anything else returns None and goes to the LLM.
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+from pydantic import ValidationError
+from models import ExpenseCategory, LineItem, Receipt
+
+AMOUNT = r"(?P<amount>\d+(?:[.,]\d{1,2})?)\s*(?P<currency>[A-Za-z]{3})?"
+
+ITEM_PATTERN = re.compile(
+    r"^(?P<quantity>\d+)\s*[x×]\s+(?P<description>.+?)\s{2,}" + AMOUNT + "$"
+)
+SUBTOTAL_PATTERN = re.compile(r"^sub-?total:?\s+" + AMOUNT + "$", re.I)
+TAX_PATTERN = re.compile(
+    r"^(?:vat|tax|moms)\s*(?:\((?P<rate>\d+(?:[.,]\d+)?)\s*%\))?:?\s+" + AMOUNT + "$",
+    re.I,
+)
+TOTAL_PATTERN = re.compile(r"^total:?\s+" + AMOUNT + "$", re.I)
+DATE_PATTERN = re.compile(
+    r"^(?P<date>[A-Za-z]+ \d{1,2}, \d{4}|\d{4}-\d{2}-\d{2})"
+    r"(?:\s*[-,]?\s*(?P<time>\d{1,2}:\d{2}))?$"
+)
+LOCATION_PATTERN = re.compile(r"^location:\s*(?P<location>.+)$", re.I)
+RECEIPT_NUMBER_PATTERN = re.compile(
+    r"^(?:receipt|order)\s*(?:no\.?|number|#):?\s*(?P<number>\S+)$", re.I
+)
+PAYMENT_PATTERN = re.compile(
+    r"^payment(?: method)?:\s*(?P<method>[A-Za-z ]+?)\s*(?:\*+(?P<last4>\d{4}))?$",
+    re.I,
+)
+
+PAYMENT_METHODS = {
+    "card": "card",
+    "credit card": "card",
+    "debit card": "card",
+    "cash": "cash",
+    "swish": "digital",
+    "apple pay": "digital",
+    "google pay": "digital",
+    "mobile": "digital",
+}
+
+# Checked in order, first match wins
+CATEGORY_KEYWORDS = {
+    "Health & Wellness": [
+        "vitamin",
+        "supplement",
+        "yoga",
+        "essential oil",
+        "massage",
+        "medicine",
+        "painkiller",
+        "bandage",
+        "sunscreen",
+    ],
+    "Household & Utilities": [
+        "detergent",
+        "sanitizer",
+        "wipe",
+        "filter",
+        "soap",
+        "toilet paper",
+        "battery",
+        "light bulb",
+        "trash bag",
+    ],
+    "Food & Beverage": [
+        "cappuccino",
+        "coffee",
+        "latte",
+        "espresso",
+        "tea",
+        "smoothie",
+        "drink",
+        "juice",
+        "water",
+        "soda",
+        "bar",
+        "snack",
+        "sandwich",
+        "bread",
+        "milk",
+        "fruit",
+        "chocolate",
+    ],
+    "Leisure & Entertainment": [
+        "game",
+        "gift card",
+        "headphone",
+        "journal",
+        "puzzle",
+        "charger",
+        "candle",
+        "book",
+        "magazine",
+        "movie",
+        "ticket",
+    ],
+}
+
+CATEGORY_PATTERNS = {
+    category: re.compile(
+        r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")(?:s|es)?\b",
+        re.I,
+    )
+    for category, keywords in CATEGORY_KEYWORDS.items()
+}
+
+
+def parse_receipt(text: str) -> Optional[Receipt]:
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if len(lines) < 3:
+        return None
+
+    fields: Dict = {
+        "merchant_name": re.sub(r"\s+RECEIPT$", "", lines[0], flags=re.I),
+        "card_last_four": None,
+    }
+    line_items: List[LineItem] = []
+    currencies = set()
+
+    try:
+        for line in lines[1:]:
+            if match := ITEM_PATTERN.match(line):
+                line_items.append(_parse_line_item(match))
+            elif match := SUBTOTAL_PATTERN.match(line):
+                fields["subtotal"] = _parse_amount(match["amount"])
+            elif match := TAX_PATTERN.match(line):
+                fields["tax_amount"] = _parse_amount(match["amount"])
+                if match["rate"]:
+                    fields["tax_rate"] = float(match["rate"].replace(",", "."))
+            elif match := TOTAL_PATTERN.match(line):
+                fields["total_amount"] = _parse_amount(match["amount"])
+            elif match := DATE_PATTERN.match(line):
+                fields["transaction_date"] = _parse_date(match["date"])
+                fields["transaction_time"] = match["time"]
+            elif match := LOCATION_PATTERN.match(line):
+                fields["merchant_location"] = match["location"]
+            elif match := RECEIPT_NUMBER_PATTERN.match(line):
+                fields["receipt_number"] = match["number"]
+            elif match := PAYMENT_PATTERN.match(line):
+                fields["payment_method"] = PAYMENT_METHODS.get(
+                    match["method"].lower(), "other"
+                )
+                fields["card_last_four"] = match["last4"]
+            else:
+                continue
+
+            if "currency" in match.groupdict() and match["currency"]:
+                currencies.add(match["currency"].upper())
+
+    except (InvalidOperation, ValueError, ValidationError):
+        return None
+
+    required = ("transaction_date", "subtotal", "tax_amount", "total_amount")
+    if not line_items or len(currencies) > 1 or any(f not in fields for f in required):
+        return None
+
+    items_total = sum(item.total_price for item in line_items)
+    if abs(items_total - fields["subtotal"]) > Decimal("0.01"):
+        return None
+
+    expense_categories = _categorize(line_items)
+    if expense_categories is None:
+        return None
+
+    try:
+        return Receipt(
+            **fields,
+            line_items=line_items,
+            currency=currencies.pop() if currencies else "USD",
+            expense_categories=expense_categories,
+            extraction_confidence=1.0,
+        )
+    except ValidationError:
+        return None
+
+
+def _parse_line_item(match: re.Match) -> LineItem:
+    quantity = int(match["quantity"])
+    total_price = _parse_amount(match["amount"])
+    unit_price = total_price / quantity
+    if unit_price * quantity != total_price:
+        unit_price = unit_price.quantize(Decimal("0.01"))
+
+    return LineItem(
+        description=match["description"].strip(),
+        quantity=quantity,
+        unit_price=unit_price,
+        total_price=total_price,
+    )
+
+
+def _parse_amount(value: str) -> Decimal:
+    return Decimal(value.replace(",", "."))
+
+
+def _parse_date(value: str) -> date:
+    for fmt in ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value}")
+
+
+def _categorize(line_items: List[LineItem]) -> Optional[List[ExpenseCategory]]:
+    grouped: Dict[str, List[LineItem]] = {}
+    for item in line_items:
+        category = next(
+            (c for c, p in CATEGORY_PATTERNS.items() if p.search(item.description)),
+            None,
+        )
+        if category is None:
+            return None
+        grouped.setdefault(category, []).append(item)
+
+    return [
+        ExpenseCategory(
+            category=category,
+            total_amount=sum(item.total_price for item in items),
+            item_count=len(items),
+            items=[f"{item.quantity}x {item.description}" for item in items],
+        )
+        for category, items in grouped.items()
+    ]
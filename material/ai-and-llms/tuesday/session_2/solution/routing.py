@@ -0,0 +1,42 @@
+"""
+Model routing cascade for structured extraction
+
+Documents go to the cheapest model tier first. Its answer is kept when it
+passes schema validation and reports enough extraction_confidence; otherwise
+the next, larger tier is tried. The last tier's answer is always accepted,
+so the cascade never does worse than calling the largest model directly.
+"""
+
+from typing import Optional, Sequence
+from pydantic import BaseModel
+
+
+class ModelRouter:
+    """Cheapest-first model tiers with a confidence gate"""
+
+    def __init__(
+        self,
+        models: Sequence[str] = ("gpt-4.1-mini", "gpt-4.1"),
+        min_confidence: float = 0.85,
+    ):
+        if not models:
+            raise ValueError("At least one model tier is required")
+        self.models = list(models)
+        self.min_confidence = min_confidence
+
+    @property
+    def cache_id(self) -> str:
+        # Cached answers depend on the whole routing policy, not just one model
+        return f"{'>'.join(self.models)}@{self.min_confidence}"
+
+    def is_last(self, tier: int) -> bool:
+        return tier >= len(self.models) - 1
+
+    def accept(self, document: Optional[BaseModel], tier: int) -> bool:
+        """Whether the answer from this tier is final; None means it failed validation"""
+        if self.is_last(tier):
+            return True
+        if document is None:
+            return False
+        confidence = getattr(document, "extraction_confidence", None)
+        return confidence is None or confidence >= self.min_confidence
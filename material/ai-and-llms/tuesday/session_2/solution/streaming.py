@@ -0,0 +1,48 @@
+"""
+Incremental event extraction from partially streamed structured output
+
+The structured-output stream delivers growing JSON snapshots of the response.
+A top-level field is complete once a later field has started (the model emits
+fields in schema order), and a line item is complete once the next item has
+started. PartialDocumentTracker turns those snapshots into ExtractionEvents
+without emitting anything twice.
+"""
+
+from typing import Iterator, Set
+from pydantic import ValidationError
+from models import ExtractionEvent, LineItem
+
+
+class PartialDocumentTracker:
+    """Emits field and line item events as a streamed document fills in"""
+
+    def __init__(self):
+        self.emitted_fields: Set[str] = set()
+        self.emitted_items = 0
+
+    def update(
+        self, snapshot: dict, complete: bool = False
+    ) -> Iterator[ExtractionEvent]:
+        keys = list(snapshot)
+        for key in keys:
+            # The last key may still be mid-value until the stream ends
+            finished = complete or key != keys[-1]
+
+            if key == "line_items":
+                items = snapshot[key] or []
+                yield from self._line_item_events(items if finished else items[:-1])
+            elif finished and key not in self.emitted_fields:
+                self.emitted_fields.add(key)
+                yield ExtractionEvent(
+                    event_type="field", field_name=key, value=snapshot[key]
+                )
+
+    def _line_item_events(self, items: list) -> Iterator[ExtractionEvent]:
+        for item in items[self.emitted_items :]:
+            self.emitted_items += 1
+            try:
+                line_item = LineItem.model_validate(item)
+            except ValidationError:
+                # The final parse reports the error in the result event
+                continue
+            yield ExtractionEvent(event_type="line_item", line_item=line_item)
@@ -6,11 +6,19 @@ Focus: Understanding concepts, not building complete systems.
 """
 
 import json
+import sys
+from pathlib import Path
 from openai import OpenAI
 from pydantic import BaseModel
 from typing import List, Optional
 
-client = OpenAI()
+sys.path.append(str(Path(__file__).resolve().parents[2] / "shared"))
+from llm_scheduler import Priority, get_scheduler
+from prompt_cache import PromptLayout, cache_report
+
+# Retries and rate limiting are handled by the shared scheduler
+client = OpenAI(max_retries=0)
+scheduler = get_scheduler()
 
 
 # ============================================================================
@@ -27,28 +35,34 @@ class MealAnalysis(BaseModel):
     confidence: float
 
 
+# Static instructions first, the order last, so the prefix is identical every call
+MEAL_ORDER_PROMPT = PromptLayout(
+    "meal-order-analysis",
+    """Analyze the meal order given by the user.
+
+Break it into individual items and decide the next action.
+Set action to:
+- 'search_database' if it's a common restaurant meal
+- 'search_web' if it's an unusual or specific item
+- 'estimate' if it's too vague to search
+
+Be specific about restaurant chains when mentioned.""",
+)
+
+
 def analyze_meal_order(order: str) -> MealAnalysis:
     """
     CONCEPT: The LLM returns structured data that tells us what to do next
     """
-    response = client.beta.chat.completions.parse(
+    response = scheduler.call(
+        client.beta.chat.completions.parse,
         model="gpt-4.1",
-        messages=[
-            {
-                "role": "user",
-                "content": f"""Analyze this meal order: "{order}"
-            
-            Break it into individual items and decide the next action.
-            Set action to:
-            - 'search_database' if it's a common restaurant meal
-            - 'search_web' if it's an unusual or specific item
-            - 'estimate' if it's too vague to search
-            
-            Be specific about restaurant chains when mentioned.""",
-            }
-        ],
+        messages=MEAL_ORDER_PROMPT.messages(f'Meal order: "{order}"'),
         response_format=MealAnalysis,
+        prompt_cache_key=MEAL_ORDER_PROMPT.name,
+        priority=Priority.INTERACTIVE,
     )
+    MEAL_ORDER_PROMPT.record(response.usage)
     return response.choices[0].message.parsed
 
 
@@ -279,3 +293,5 @@ if __name__ == "__main__":
     print("2. Context must be carefully managed across calls")
     print("3. Fallbacks are essential for robust systems")
     print("4. Not every task needs orchestration")
+
+    print(f"\nPrompt cache: {cache_report()}")